@@ -1,19 +1,38 @@
 import streamlit as st
 import streamlit.components.v1 as components
 from streamlit_chat import message
-from neo4j_driver import execute_query
+from neo4j_driver import execute_query, wait_for, query_metrics, cache_stats, breaker_status, warm_up_report, uses_database, QueryError
+from circuit_breaker import stale_age
+from config import secret, secret_flag
 import openai
 from train_cypher import examples
-from utils import list_from_csv
+from utils import list_from_csv, rerun_check
 from constants import STAR_WARS_SYSTEMS
-from models import Person, System
+from network import (
+    possible_rebel_system_names,
+    affinity_as_float,
+    top_skills_from_records,
+    find_developers,
+    devs_ranked_from_columns,
+    rank_query,
+    LANGUAGE_KEY,
+)
+import queries
+import distance_table
+import schema
 import random
 import datetime
+import concurrent.futures
 
 # Config
 # openai.api_key = st.secrets['OPENAI_KEY']
 DEFAULT_TIME_CUTOFF = st.secrets['DEFAULT_TIME_CUTOFF_MINUTES']
 st.set_page_config(layout="wide")
+# Once per server process: create missing indexes and constraints, and keep jump distances from rebel bases written.
+# Embedded and replay backends need no database
+if uses_database():
+    schema.start(secret_flag("NEO4J_ENSURE_SCHEMA", True))
+    distance_table.start(float(secret("JUMP_TABLE_REFRESH_SECONDS", 0)))
 
 # Functions
 @st.cache_data
@@ -25,179 +44,10 @@ def star_wars_systems():
     system_names = [s['Planet'] for s in STAR_WARS_SYSTEMS]
     return system_names
 
-@st.cache_data
-def possible_rebel_systems(minimum_rebel_affinity: float= 0.5):
-    query = f"""
-MATCH (s:System)
-WHERE ANY (affinity IN s.rebel_affinity WHERE affinity > {minimum_rebel_affinity})
-RETURN DISTINCT s
-    """
-    systems = execute_query(query)
-    result = []
-    for r in systems:
-        s = r.get('s')
-        new_system = (System(
-            name=s.get('name', None), 
-            x=s.get('X', None), 
-            y=s.get('Y', None), 
-            region=s.get('Region', None), 
-            type='Rebel System', 
-            importance=s.get('importance', None),
-            rebel_affinity=s.get('rebel_affinity', None)))
-        result.append(new_system)
-    return result
-
-@st.cache_data
-def possible_rebel_system_names(minimum_rebel_affinity: float= 0.5):
-    systems = possible_rebel_systems(minimum_rebel_affinity)
-    names = [s.name for s in systems]
-    return names
-    
-def affinity_as_float(affinity:str)-> float:
-    if affinity == "Imperial":
-        return 0.0
-    elif affinity == "Imperial Sympathetic":
-        return 0.25
-    elif affinity == "Neutral":
-        return 0.5
-    elif affinity == "Rebel Sympathetic":
-        return 0.75
-    else:
-        return 1.0
-
-
-LANGUAGE_KEY = "Language"
-COUNT_KEY = "Developers who know"
-
-def get_current_top_skills(max: int = 10):
-    query = f"""
-MATCH (:Person)-[:KNOWS]->(t:Topic)
-RETURN DISTINCT t.name as name, count(t.name) as count
-ORDER BY count DESC LIMIT {max}
-    """
-    records = execute_query(query)
-    result = []
-    for r in records:
-        result.append(
-            {
-                LANGUAGE_KEY: r.get('name'),
-                COUNT_KEY: r.get('count')
-            }
-        )
-    return result
-
-@st.cache_data
-def find_developers(
-    team_size: int,
-    req_skills: list[str],
-    base: str,
-    distance: int,
-    reb_affinity: float
-) -> list[str]:
-    
-    query = f"""
-MATCH (p:Person)-[:KNOWS]->(t:Topic)
-MATCH (p)-[f:FROM]->(s:System)-[d:CONNECTED_TO|NEAR*0..{distance}]->(s2:System)
-MATCH (p)-[:KNOWS]->(c:Character)
-WHERE ANY (name IN t.name WHERE name in $req_skills) AND s2.name = $base
-WITH p, t, s, c, avg(c.rebel_affinity) as avg_affinity
-WHERE avg_affinity >= {reb_affinity}
-RETURN DISTINCT p.name as name, s.name as homeworld, collect(DISTINCT t.name) as skills, collect(DISTINCT c.name) as associates, avg(c.rebel_affinity) as avg_affinity LIMIT $team_size
-    """
-    params = {
-        'req_skills': req_skills,
-        'base': base,
-        'team_size': team_size
-    }
-    records = execute_query(query, params)
-    if records is None:
-        return []
-    
-    result = []
-    for r in records:
-        result.append({
-            'name': r.get('name'),
-            'homeworld': r.get('homeworld'),
-            'skills': r.get('skills'),
-            'associates': r.get('associates'),
-            'affinity': r.get('avg_affinity')
-        })
-    return result
-
-def devs_with_rank_info(
-    base: str,
-    cutoff_datetime: datetime
-):
-    if cutoff_datetime is None:
-        # Set to 1/1/1970
-        cutoff_datetime = datetime.datetime.utcfromtimestamp(0)
-    query = f"""
-MATCH (p:Person)-[r:KNOWS]->(t:Topic),
-(p)-[:FROM]->(s:System),
-(p)-[:KNOWS]->(c:Character),
-(base:System),
-path = shortestPath((s)-[:CONNECTED_TO|NEAR*0..100]-(base))
-WHERE base.name = $base AND p.created_at >= datetime($datetime_cutoff)
-WITH p, t, c, s, path
-RETURN DISTINCT p.name as name, toString(p.created_at) as createdAt, p.email as email, s.name as homeworld, collect(DISTINCT c.name) as associates, collect(DISTINCT t.name) as devSkills, avg(c.rebel_affinity) as avg_associate_affinity, count(nodes(path)) as jumpsFromBase
-    """
-    params ={
-        'base': base,
-        'datetime_cutoff': cutoff_datetime.isoformat()
-    }
-    response = execute_query(query, params)
-    result = []
-    for r in response:
-        created_at_string = r.get('createdAt', None)
-        created_at = datetime.datetime.strptime(created_at_string, '%Y-%m-%dT%H:%M:%S.%fZ')
-        # Below fails in streamlit cloud (using an older version of Python currently?)
-        # created_at = datetime.datetime.fromisoformat(created_at_string) 
-        dev = Person(
-            name=r.get('name', None), 
-            # email=r.get('email', None),
-            homeworld=r.get('homeworld', None), 
-            created_at=created_at,
-            skills=r.get('devSkills', None), 
-            associates=r.get('associates', None), 
-            avg_associate_affinity=r.get('avg_associate_affinity', None),
-            jumps_from_base=r.get('jumpsFromBase', None))
-        result.append(dev)
-    return result
-
-def devs_ranked(
-    devs: list[Person],
-    skills: list[str],
-    skills_points_per: float,
-    associate_rebel_affinity: float,
-    associate_rebel_affinity_points_per: float,
-    max_distance_points: float,
-    distance_decay_per_jump: float
-):
-    for dev in devs:
-        dev_score = 0.0
-        skill_points = 0.0
-        affinity_points = 0.0
-        distance_points = 0.0
-        dev.matching_skills = 0
-        for skill in skills:
-            if skill in dev.skills:
-                skill_points += skills_points_per
-                dev.matching_skills += 1
-        if dev.avg_associate_affinity is None or dev.avg_associate_affinity < associate_rebel_affinity:
-            affinity_points = 0
-        else:
-            affinity_points = associate_rebel_affinity_points_per * dev.avg_associate_affinity
-        distance_points =  max_distance_points - distance_decay_per_jump * dev.jumps_from_base
-        if distance_points < 0:
-            distance_points = 0
-
-        dev_score += skill_points
-        dev_score += affinity_points
-        dev_score += distance_points
-        dev.ranking_score = dev_score
-
-    # Return list of devs ranked
-    return sorted(devs, key=lambda x: x.ranking_score, reverse=True)
+def show_if_stale(result):
+    age = stale_age(result)
+    if age is not None:
+        st.warning(f"The database isn't responding, showing results from {age / 60:.0f} minutes ago")
 
 # UI
 
@@ -221,7 +71,12 @@ with col3:
     # Base location
     base1, base2 = st.columns(2)
     with base1:
-        rebel_bases = possible_rebel_system_names()
+        try:
+            rebel_bases = possible_rebel_system_names()
+        except QueryError as e:
+            st.error(f"Could not load rebel systems: {e}")
+            st.stop()
+        show_if_stale(rebel_bases)
         if st.button("Change Base Location"):
             rebel_base = random.choice(rebel_bases)
     with base2:
@@ -231,9 +86,25 @@ with col3:
             rebel_base = random.choice(rebel_bases)
             st.write(f"Current Location: {rebel_base}")
     
-    # Top skills
+    # Top skills and ranking data don't depend on each other, fetch them concurrently.
+    # Ranking rows come back as columns and are only waited on once the Ranking tab renders.
+    # Stop waiting on the database as soon as this session reruns
+    cancel_check = rerun_check()
+    top_skills_future = queries.submit('top_skills', {'max': st.secrets["TOP_SKILLS_TO_SHOW"]})
+    try:
+        rank_future = queries.submit(*rank_query(rebel_base, date_cutoff), columnar=True)
+    except QueryError as e:
+        # Loading the hyperspace links or jump tables failed, report it where the ranking would have been
+        rank_future = concurrent.futures.Future()
+        rank_future.set_exception(e)
     st.write('Top skills in network:')
-    top_skills = get_current_top_skills(st.secrets["TOP_SKILLS_TO_SHOW"])
+    try:
+        top_skills_records = wait_for(top_skills_future, cancel_check)
+        show_if_stale(top_skills_records)
+        top_skills = top_skills_from_records(top_skills_records)
+    except QueryError as e:
+        st.error(f"Could not load top skills: {e}")
+        top_skills = []
     st.table(top_skills)
 
 # st.title("Rebel Developers Network")
@@ -255,14 +126,19 @@ with t1:
     
     # TODO:
     if st.button("Find Rebel Developers"):
-        developers = find_developers(
-            team_size, 
-            req_skills, 
-            base, 
-            distance, 
-            affinity_as_float(reb_affinity))
-        # Display suggested rebel developers
-        st.json(developers)
+        try:
+            developers = find_developers(
+                team_size, 
+                req_skills, 
+                base, 
+                distance, 
+                affinity_as_float(reb_affinity))
+        except QueryError as e:
+            st.error(f"Could not search developers: {e}")
+        else:
+            # Display suggested rebel developers
+            show_if_stale(developers)
+            st.json(developers)
 
 with t2:
     with st.expander("Ranking Rubric"):
@@ -287,24 +163,34 @@ with t2:
             # Trustability Scoring
             trust_score = st.slider("Points per average associate affinity", 0, 100, 10, help="Points per average affinity of associates. Associates are people who know the developer and are also rebel sympathizers. This many points will be assigned for matching the requirement level + this number of points for each .1 above the requirement level.")
     
-    devs = devs_with_rank_info(
-        rebel_base,
-        date_cutoff
+    try:
+        rank_columns = wait_for(rank_future, cancel_check)
+        show_if_stale(rank_columns)
+        devs_ranked = devs_ranked_from_columns(
+            columns=rank_columns,
+            skills=req_skills,
+            skills_points_per=skills_score,
+            associate_rebel_affinity=affinity_as_float(reb_affinity),
+            associate_rebel_affinity_points_per=trust_score,
+            max_distance_points=distance_score,
+            distance_decay_per_jump=distance_score_dropoff,
+            limit=st.secrets.get("RANKED_DEVS_TO_SHOW")
         )
-    devs_ranked = devs_ranked(
-        devs=devs,
-        skills=req_skills,
-        skills_points_per=skills_score,
-        associate_rebel_affinity=affinity_as_float(reb_affinity),
-        associate_rebel_affinity_points_per=trust_score,
-        max_distance_points=distance_score,
-        distance_decay_per_jump=distance_score_dropoff
-    )
+    except QueryError as e:
+        st.error(f"Could not load developer rankings: {e}")
+        devs_ranked = []
     st.write("Developers Ranked")
     st.table(devs_ranked)        
             
 
 with t3:
+    with st.expander("Query metrics"):
+        # Busiest queries first, counters are only present for writes
+        st.table([{'query': name, **stats} for name, stats in query_metrics().items()])
+        st.write("Result cache", cache_stats())
+        st.write("Circuit breakers", breaker_status())
+        st.write("Connection warm-up", warm_up_report())
+        st.write("Schema", schema.last_report())
     # Building mode
     components.iframe("https://neodash.graphapp.io/", height=1000, scrolling=False)
 
@@ -0,0 +1,218 @@
+"""Rough latency benchmarks for the database layer.
+
+Settings come from .streamlit/secrets.toml or environment variables, see config.py:
+
+    pipenv run python src/benchmark.py pool --runs 50
+    pipenv run python src/benchmark.py ingest --rows 20000 --batch-size 1000
+    pipenv run python src/benchmark.py causal --runs 50   # read-your-writes, works on a single instance too
+    pipenv run python src/benchmark.py fanout --people 200 --topics 40 --characters 40
+    pipenv run python src/benchmark.py record --log recordings/app.jsonl.gz
+    pipenv run python src/benchmark.py replay --log recordings/app.jsonl.gz   # no database needed
+"""
+import argparse
+import statistics
+import time
+from neo4j import GraphDatabase, basic_auth
+import neo4j_driver
+import network
+import queries
+import replay
+
+DEFAULT_QUERY = "MATCH (s:System) RETURN count(s) as count"
+
+def report(label: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{label:<24} runs={len(timings):<5} mean={statistics.mean(timings) * 1000:8.2f}ms "
+          f"p50={statistics.median(timings) * 1000:8.2f}ms p95={p95 * 1000:8.2f}ms")
+
+def time_calls(fn, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def driver_per_call(query: str):
+    # What execute_query used to do: a new driver, handshake and auth every time
+    with GraphDatabase.driver(neo4j_driver.host, auth=basic_auth(neo4j_driver.user, neo4j_driver.password)) as driver:
+        driver.execute_query(query)
+
+def bench_pool(args):
+    report("driver per call", time_calls(lambda: driver_per_call(args.query), args.runs))
+    # First call creates the pooled driver, keep it out of the steady state numbers
+    neo4j_driver.execute_query(args.query)
+    report("pooled driver", time_calls(lambda: neo4j_driver.execute_query(args.query), args.runs))
+
+BENCH_WRITE = """
+UNWIND $rows AS row
+CREATE (:BenchmarkRow {id: row.id, name: row.name, created_at: datetime()})
+"""
+
+def bench_ingest(args):
+    rows = ({'id': i, 'name': f'dev-{i}'} for i in range(args.rows))
+    result = neo4j_driver.execute_batch(BENCH_WRITE, rows, args.batch_size)
+    print(f"ingest batch_size={args.batch_size:<6} rows={result.rows:<8} batches={result.batches:<5} "
+          f"{result.seconds:6.2f}s {result.rows_per_second:10.0f} rows/s")
+    neo4j_driver.execute_batch("UNWIND $rows AS row MATCH (b:BenchmarkRow {id: row}) DELETE b", range(args.rows), args.batch_size)
+
+BENCH_READ = "MATCH (b:BenchmarkRow {id: $id}) RETURN count(b) AS count"
+
+def bench_causal(args):
+    """Writes a row then reads it straight back through a READ session, which must always see it."""
+    missed = 0
+    timings = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        neo4j_driver.execute_batch(BENCH_WRITE, [{'id': i, 'name': f'dev-{i}'}], invalidates=[])
+        records = neo4j_driver.execute_query(BENCH_READ, {'id': i}, name='causal_read')
+        timings.append(time.perf_counter() - start)
+        if records[0].get('count') == 0:
+            missed += 1
+    report("write then read", timings)
+    print(f"reads missing their write: {missed}")
+    neo4j_driver.execute_batch("UNWIND $rows AS row MATCH (b:BenchmarkRow {id: row}) DELETE b", range(args.runs))
+
+# rank_info as it was before skills and associates moved into subqueries, for comparison
+CARTESIAN_RANK_INFO = """
+UNWIND $systems AS system
+MATCH (s:System {name: system.name})<-[:FROM]-(p:Person)
+WHERE p.created_at >= datetime($datetime_cutoff)
+MATCH (p)-[r:KNOWS]->(t:Topic)
+MATCH (p)-[:KNOWS]->(c:Character)
+RETURN p.name as name, toString(p.created_at) as createdAt, p.email as email, s.name as homeworld, collect(DISTINCT c.name) as associates, collect(DISTINCT t.name) as devSkills, avg(c.rebel_affinity) as avg_associate_affinity, system.jumps as jumpsFromBase
+"""
+
+# Every node is also a :BenchmarkRow with an id, so the cleanup below removes all of it
+BENCH_FANOUT_NODES = """
+UNWIND $rows AS row
+FOREACH (_ IN CASE WHEN row.label = 'System' THEN [1] ELSE [] END | CREATE (:BenchmarkRow:System {id: row.id, name: row.name}))
+FOREACH (_ IN CASE WHEN row.label = 'Topic' THEN [1] ELSE [] END | CREATE (:BenchmarkRow:Topic {id: row.id, name: row.name}))
+FOREACH (_ IN CASE WHEN row.label = 'Character' THEN [1] ELSE [] END | CREATE (:BenchmarkRow:Character {id: row.id, name: row.name, rebel_affinity: row.rebel_affinity}))
+"""
+
+BENCH_FANOUT_PEOPLE = """
+UNWIND $rows AS row
+MATCH (s:BenchmarkRow:System {name: row.system})
+CREATE (p:BenchmarkRow:Person {id: row.id, name: row.name, email: row.name, created_at: datetime()})-[:FROM]->(s)
+WITH p, row
+CALL {
+    WITH p, row
+    UNWIND row.topics AS topic
+    MATCH (t:BenchmarkRow:Topic {name: topic})
+    CREATE (p)-[:KNOWS]->(t)
+}
+CALL {
+    WITH p, row
+    UNWIND row.characters AS character
+    MATCH (c:BenchmarkRow:Character {name: character})
+    CREATE (p)-[:KNOWS]->(c)
+}
+"""
+
+def bench_fanout(args):
+    """Developers who each know many topics and characters, ranked by the old and the current rank_info."""
+    system = 'Benchmark System'
+    nodes = [{'id': 0, 'label': 'System', 'name': system, 'rebel_affinity': None}]
+    nodes += [{'id': 1 + i, 'label': 'Topic', 'name': f'bench-topic-{i}', 'rebel_affinity': None} for i in range(args.topics)]
+    nodes += [{'id': 1 + args.topics + i, 'label': 'Character', 'name': f'bench-character-{i}', 'rebel_affinity': i / args.characters}
+              for i in range(args.characters)]
+    first_person = len(nodes)
+    people = [{
+        'id': first_person + i,
+        'name': f'bench-dev-{i}',
+        'system': system,
+        'topics': [f'bench-topic-{t}' for t in range(args.topics)],
+        'characters': [f'bench-character-{c}' for c in range(args.characters)],
+    } for i in range(args.people)]
+    neo4j_driver.execute_batch(BENCH_FANOUT_NODES, nodes)
+    neo4j_driver.execute_batch(BENCH_FANOUT_PEOPLE, people, 100)
+    try:
+        params = queries.rank_info_params({system: 0}, None)
+        print(f"{args.people} developers x {args.topics} topics x {args.characters} characters")
+        for label, text in [('cartesian rank_info', CARTESIAN_RANK_INFO), ('rank_info', queries.RANK_INFO.text)]:
+            report(label, time_calls(lambda: neo4j_driver.execute_query(text, params, name=label), args.runs))
+    finally:
+        neo4j_driver.execute_batch("UNWIND $rows AS row MATCH (b:BenchmarkRow {id: row}) DETACH DELETE b", range(first_person + args.people))
+
+APP_SKILLS = ["Python", "JavaScript", "Go"]
+
+def app_calls(base: str) -> dict:
+    """The app's data functions with fixed arguments, so recordings and replays line up."""
+    def ranked():
+        devs = network.devs_with_rank_info(base, None)
+        return network.devs_ranked(devs, APP_SKILLS, 10, 0.5, 10, 10, 1.0)
+    return {
+        'possible_rebel_system_names': network.possible_rebel_system_names,
+        'get_current_top_skills': lambda: network.get_current_top_skills(10),
+        'find_developers': lambda: network.find_developers(6, APP_SKILLS, base, 10, 0.5),
+        'devs_with_rank_info + devs_ranked': ranked,
+    }
+
+def first_rebel_base() -> str:
+    names = sorted(network.possible_rebel_system_names())
+    return names[0] if names else None
+
+def bench_record(args):
+    neo4j_driver.set_recorder(replay.Recorder(args.log))
+    base = args.base or first_rebel_base()
+    for label, fn in app_calls(base).items():
+        neo4j_driver.invalidate_cache()
+        fn()
+        print(f"recorded {label}")
+    print(f"base={base} log={args.log}")
+
+def bench_replay(args):
+    neo4j_driver.set_backend(replay.ReplayBackend(args.log, args.latency_scale, args.latency))
+    base = args.base or first_rebel_base()
+    for label, fn in app_calls(base).items():
+        def uncached():
+            neo4j_driver.invalidate_cache()
+            fn()
+        report(label, time_calls(uncached, args.runs))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pool = subparsers.add_parser("pool", help="per-query latency, new driver per call vs pooled driver")
+    pool.add_argument("--runs", type=int, default=20)
+    pool.add_argument("--query", default=DEFAULT_QUERY)
+    pool.set_defaults(func=bench_pool)
+
+    ingest = subparsers.add_parser("ingest", help="UNWIND batch write throughput, using throwaway :BenchmarkRow nodes")
+    ingest.add_argument("--rows", type=int, default=20000)
+    ingest.add_argument("--batch-size", type=int, default=neo4j_driver.DEFAULT_BATCH_SIZE)
+    ingest.set_defaults(func=bench_ingest)
+
+    causal = subparsers.add_parser("causal", help="write then read back through read routing, counting reads that miss their write")
+    causal.add_argument("--runs", type=int, default=50)
+    causal.set_defaults(func=bench_causal)
+
+    fanout = subparsers.add_parser("fanout", help="rank query over developers who know many topics and characters, old vs current")
+    fanout.add_argument("--people", type=int, default=200)
+    fanout.add_argument("--topics", type=int, default=40)
+    fanout.add_argument("--characters", type=int, default=40)
+    fanout.add_argument("--runs", type=int, default=10)
+    fanout.set_defaults(func=bench_fanout)
+
+    record = subparsers.add_parser("record", help="run the app's data functions against the database and record the results")
+    record.add_argument("--log", required=True)
+    record.add_argument("--base", help="rebel base, defaults to the first rebel system")
+    record.set_defaults(func=bench_record)
+
+    replay_ = subparsers.add_parser("replay", help="time the app's data functions and devs_ranked against a recording")
+    replay_.add_argument("--log", required=True)
+    replay_.add_argument("--base", help="rebel base used when recording, defaults to the first rebel system")
+    replay_.add_argument("--runs", type=int, default=20)
+    replay_.add_argument("--latency-scale", type=float, default=0.0, help="multiplier on recorded query times")
+    replay_.add_argument("--latency", type=float, help="fixed simulated latency per query in seconds")
+    replay_.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    args.func(args)
+    neo4j_driver.close_driver()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Per query circuit breakers, and the wrappers that mark a result as stale."""
+from dataclasses import dataclass
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+@dataclass
+class CircuitBreaker:
+    # Consecutive failures that open the circuit
+    failure_threshold: int = 3
+    # Seconds an open circuit waits before letting one trial call through
+    reset_timeout: float = 30.0
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    # Times the circuit has opened, for the metrics page
+    trips: int = 0
+
+    def try_trial(self, now: float) -> bool:
+        """True for a single caller once reset_timeout has passed on an open circuit, that caller runs the trial.
+
+        A trial that never reports back (e.g. it was cancelled) is replaced after another reset_timeout.
+        """
+        if self.state != CLOSED and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self, now: float):
+        self.failures += 1
+        # A failed trial reopens straight away
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state == CLOSED:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = now
+
+class BreakerRegistry:
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def is_closed(self, name: str) -> bool:
+        with self._lock:
+            return self._get(name).state == CLOSED
+
+    def try_trial(self, name: str) -> bool:
+        with self._lock:
+            return self._get(name).try_trial(time.monotonic())
+
+    def success(self, name: str):
+        with self._lock:
+            self._get(name).success()
+
+    def failure(self, name: str):
+        with self._lock:
+            self._get(name).failure(time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {'state': b.state, 'failures': b.failures, 'trips': b.trips}
+                for name, b in sorted(self._breakers.items())
+            }
+
+class StaleRecords(list):
+    """Records from the last good run of a query, served while its circuit is open."""
+    def __init__(self, records, age: float):
+        super().__init__(records)
+        self.age = age
+
+class StaleColumns(dict):
+    """Columnar counterpart of StaleRecords."""
+    def __init__(self, columns, age: float):
+        super().__init__(columns)
+        self.age = age
+
+def stale(result, stored_at: float):
+    age = time.time() - stored_at
+    return StaleColumns(result, age) if isinstance(result, dict) else StaleRecords(result, age)
+
+def stale_age(result) -> float:
+    """Seconds since a stale result was fetched from the database, None for a fresh result."""
+    return getattr(result, 'age', None)
+
+def keep_stale(source, result: list) -> list:
+    """result, a list converted from source, marked stale with source's age when source was stale."""
+    age = stale_age(source)
+    return result if age is None else StaleRecords(result, age)
@@ -0,0 +1,48 @@
+"""Settings from environment variables or .streamlit/secrets.toml, without importing Streamlit.
+
+Scripts, benchmarks and worker processes read the same settings as the app, an environment
+variable of the same name overrides the secrets file:
+
+    NEO4J_URI=neo4j://localhost:7687 python src/benchmark.py pool
+"""
+import os
+import tomllib
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Later files override earlier ones, like Streamlit's global then per project secrets
+SECRETS_PATHS = [
+    os.path.join(os.path.expanduser('~'), '.streamlit', 'secrets.toml'),
+    os.path.join(REPO_DIR, '.streamlit', 'secrets.toml'),
+    os.path.join(os.getcwd(), '.streamlit', 'secrets.toml'),
+]
+
+_secrets = None
+
+def load_secrets(paths: list[str] = SECRETS_PATHS) -> dict:
+    secrets = {}
+    for path in dict.fromkeys(os.path.realpath(p) for p in paths):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                secrets.update(tomllib.load(f))
+    return secrets
+
+def secrets() -> dict:
+    global _secrets
+    if _secrets is None:
+        _secrets = load_secrets()
+    return _secrets
+
+def secret(name: str, default=None):
+    """The environment variable name, else the value from secrets.toml, else default. Missing files are not an error."""
+    value = os.environ.get(name)
+    if value is not None:
+        return value
+    return secrets().get(name, default)
+
+def secret_flag(name: str, default: bool = False) -> bool:
+    """secret() as a bool. Environment variables are strings, so "false", "0", "no" and "off" are false."""
+    value = secret(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', 'false', '0', 'no', 'off')
+    return bool(value)
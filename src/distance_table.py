@@ -0,0 +1,141 @@
+"""Background job that writes jump distances from each candidate rebel base into the database.
+
+Once a base's distances are written for the current graph version, ranking for that base reads
+them through the JumpDistance(base, version) index instead of searching paths (see
+network.rank_query). Run it as a worker, or let the app run it on a thread with
+JUMP_TABLE_REFRESH_SECONDS in secrets:
+
+    pipenv run python src/distance_table.py                 # once
+    pipenv run python src/distance_table.py --interval 300  # keep refreshing
+"""
+import argparse
+import logging
+import threading
+import time
+import uuid
+import neo4j_driver
+import network
+import queries
+import schema
+
+# Indexes in schema.py the tables are written and read through
+INDEXES = ['jump_distance_base_version', 'jump_table_version']
+
+# Each write of a base's distances is a new table with its own id, next to any earlier one
+WRITE_JUMP_DISTANCES = """
+UNWIND $rows AS row
+CREATE (:JumpDistance {base: row.base, version: row.version, table: row.table, system: row.system, jumps: row.jumps})
+"""
+
+# Written once all the table's distances are in, and only then do reads switch over to it
+MARK_JUMP_TABLE = """
+UNWIND $rows AS row
+MERGE (t:JumpTable {base: row.base, version: row.version})
+SET t.table = row.table, t.systems = row.systems, t.updated_at = datetime()
+"""
+
+# The table a forced rewrite replaced, and leftovers of a run that stopped part way
+CLEAR_JUMP_DISTANCES = """
+UNWIND $rows AS row
+MATCH (d:JumpDistance {base: row.base, version: row.version})
+WHERE d.table IS NULL OR d.table <> row.table
+DELETE d
+"""
+
+# rows: {base, version}, drops every other version of that base's table
+DROP_OLD_JUMP_TABLES = """
+UNWIND $rows AS row
+CALL {
+    WITH row
+    MATCH (d:JumpDistance {base: row.base}) WHERE d.version <> row.version
+    DELETE d
+}
+CALL {
+    WITH row
+    MATCH (t:JumpTable {base: row.base}) WHERE t.version <> row.version
+    DELETE t
+}
+"""
+
+# Other processes can hold the previous graph version in their cached system_links for up to its
+# TTL, plus a cached jump_tables result listing that version's bases, so its tables are kept until
+# that long after the current version's first table was written
+OLD_VERSION_GRACE = queries.SYSTEM_LINKS.ttl + queries.JUMP_TABLES.ttl
+
+# Includes distances left behind by a run that stopped before marking its table
+OLD_JUMP_TABLE_BASES = """
+MATCH (t:JumpTable {version: $version})
+WITH min(t.updated_at) as since
+WHERE since < datetime() - duration({seconds: $grace})
+MATCH (d:JumpDistance) WHERE d.version <> $version
+RETURN DISTINCT d.base as base
+"""
+
+def materialize_base(base: str, version: str) -> int:
+    """Writes base's distances as a new table and switches reads over to it, so a rewrite of a
+    table that is already in use never shows readers a partial one."""
+    jumps = network.distances_from(base)
+    table = uuid.uuid4().hex
+    rows = ({'base': base, 'version': version, 'table': table, 'system': system, 'jumps': n} for system, n in jumps.items())
+    neo4j_driver.execute_batch(WRITE_JUMP_DISTANCES, rows, invalidates=[], name='write_jump_distances')
+    neo4j_driver.execute_batch(MARK_JUMP_TABLE, [{'base': base, 'version': version, 'table': table, 'systems': len(jumps)}],
+                               invalidates=['jump_tables', 'rank_info_materialized'], name='mark_jump_table')
+    neo4j_driver.execute_batch(CLEAR_JUMP_DISTANCES, [{'base': base, 'version': version, 'table': table}],
+                               invalidates=[], name='clear_jump_distances')
+    return len(jumps)
+
+def materialize(bases: list[str] = None, force: bool = False) -> dict:
+    """Writes distances for bases (default: every candidate rebel base) missing them for the current
+    graph version, then drops older versions once OLD_VERSION_GRACE has passed. Returns systems written per base."""
+    schema.ensure(INDEXES)
+    version = network.hyperspace()['version']
+    bases = bases or network.possible_rebel_system_names()
+    done = set() if force else network.materialized_bases(version)
+    written = {}
+    for base in bases:
+        if base not in done:
+            written[base] = materialize_base(base, version)
+    old = [r.get('base') for r in neo4j_driver.execute_query(OLD_JUMP_TABLE_BASES, {'version': version, 'grace': OLD_VERSION_GRACE})]
+    if old:
+        # One base per transaction keeps each delete to a single table's worth of nodes
+        neo4j_driver.execute_batch(DROP_OLD_JUMP_TABLES, [{'base': base, 'version': version} for base in old], 1,
+                                   invalidates=['jump_tables'], name='drop_old_jump_tables')
+    logging.info(f"distance_table: wrote {len(written)} bases for graph version {version[:8]}, dropped {len(old)} old")
+    return written
+
+def refresh_forever(interval: float):
+    while True:
+        try:
+            materialize()
+        except neo4j_driver.QueryError as e:
+            logging.warning(f"distance_table: refresh failed: {e}")
+        except Exception:
+            # e.g. the driver errors schema.ensure() raises untyped while the database restarts,
+            # the next refresh should still run
+            logging.exception("distance_table: refresh failed")
+        time.sleep(interval)
+
+_thread = None
+
+def start(interval: float):
+    """Refreshes the tables every interval seconds on a daemon thread, once per process. 0 disables."""
+    global _thread
+    if interval and interval > 0 and _thread is None:
+        _thread = threading.Thread(target=refresh_forever, args=(interval,), name="distance-table", daemon=True)
+        _thread.start()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bases", nargs="*", help="bases to write, defaults to every candidate rebel base")
+    parser.add_argument("--force", action="store_true", help="rewrite bases that are already up to date")
+    parser.add_argument("--interval", type=float, help="keep refreshing every interval seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.interval:
+        refresh_forever(args.interval)
+    for base, systems in materialize(args.bases, args.force).items():
+        print(f"{base:<24} {systems} systems")
+    neo4j_driver.close_driver()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""In-process graph backend that answers the app's named queries without a database.
+
+Loads Person, Topic, Character and System nodes plus KNOWS/FROM/CONNECTED_TO/NEAR edges into
+indexed Python structures, from Neo4j or from a snapshot file:
+
+    graph = EmbeddedGraph.from_neo4j()
+    graph.save("snapshots/network.json.gz")
+    neo4j_driver.set_backend(EmbeddedGraph.load("snapshots/network.json.gz"))
+
+Results have the same keys and values as the Cypher in queries.py.
+"""
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field, asdict
+import datetime
+import gzip
+import json
+from neo4j import Record
+
+EXPORT_SYSTEMS = "MATCH (s:System) RETURN properties(s) AS props"
+EXPORT_LINKS = "MATCH (a:System)-[:CONNECTED_TO|NEAR]->(b:System) RETURN a.name AS source, b.name AS target"
+EXPORT_CHARACTERS = "MATCH (c:Character) RETURN c.name AS name, c.rebel_affinity AS rebel_affinity"
+EXPORT_PEOPLE = """
+MATCH (p:Person)
+RETURN p.name AS name, p.email AS email, toString(p.created_at) AS created_at,
+    head([(p)-[:FROM]->(s:System) | s.name]) AS homeworld,
+    [(p)-[:KNOWS]->(t:Topic) | t.name] AS skills,
+    [(p)-[:KNOWS]->(c:Character) | c.name] AS associates
+"""
+
+@dataclass
+class EmbeddedPerson:
+    name: str
+    email: str
+    created_at: str
+    homeworld: str
+    skills: list[str] = field(default_factory=list)
+    associates: list[str] = field(default_factory=list)
+    # Parsed created_at, filled in when the graph is indexed
+    created: datetime.datetime = field(default=None, init=False, repr=False)
+
+def parse_datetime(value: str) -> datetime.datetime:
+    """Naive UTC datetime from an ISO string, with or without an offset."""
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class EmbeddedGraph:
+    def __init__(self, systems: dict, links: list, characters: dict, people: list):
+        # System name -> properties, as stored on the node
+        self.systems = systems
+        self.links = links
+        # Character name -> rebel_affinity
+        self.characters = characters
+        self.people = people
+        self._index()
+        self.handlers = {
+            'rebel_systems': self.rebel_systems,
+            'top_skills': self.top_skills,
+            'find_developers': self.find_developers,
+            'rank_info': self.rank_info,
+            'system_links': self.system_links,
+            'jump_tables': self.jump_tables,
+        }
+
+    def _index(self):
+        self.people_by_homeworld = defaultdict(list)
+        self.skill_counts = Counter()
+        for person in self.people:
+            person.created = parse_datetime(person.created_at) if person.created_at else None
+            self.people_by_homeworld[person.homeworld].append(person)
+            self.skill_counts.update(person.skills)
+
+    @classmethod
+    def from_neo4j(cls) -> "EmbeddedGraph":
+        import neo4j_driver
+        systems = {}
+        for r in neo4j_driver.stream_query(EXPORT_SYSTEMS):
+            props = dict(r.get('props'))
+            systems[props['name']] = props
+        links = [(r.get('source'), r.get('target')) for r in neo4j_driver.stream_query(EXPORT_LINKS)]
+        characters = {r.get('name'): r.get('rebel_affinity') for r in neo4j_driver.stream_query(EXPORT_CHARACTERS)}
+        people = [EmbeddedPerson(**r.data()) for r in neo4j_driver.stream_query(EXPORT_PEOPLE)]
+        return cls(systems, links, characters, people)
+
+    def save(self, path: str):
+        snapshot = {
+            'systems': self.systems,
+            'links': self.links,
+            'characters': self.characters,
+            'people': [{k: v for k, v in asdict(p).items() if k != 'created'} for p in self.people],
+        }
+        with gzip.open(path, 'wt') as f:
+            json.dump(snapshot, f, separators=(',', ':'), default=str)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddedGraph":
+        with gzip.open(path, 'rt') as f:
+            snapshot = json.load(f)
+        people = [EmbeddedPerson(**p) for p in snapshot['people']]
+        return cls(snapshot['systems'], [tuple(link) for link in snapshot['links']], snapshot['characters'], people)
+
+    def run(self, query: str, params: dict, name: str = None) -> list:
+        """Backend entry point for neo4j_driver.set_backend. Only the app's named queries are supported."""
+        handler = self.handlers.get(name)
+        if handler is None:
+            raise LookupError(f"The embedded graph can't answer query '{name}'")
+        return handler(**params)
+
+    def rebel_systems(self, minimum_rebel_affinity: float):
+        result = []
+        for props in self.systems.values():
+            affinities = props.get('rebel_affinity') or []
+            if not isinstance(affinities, list):
+                affinities = [affinities]
+            if any(a is not None and a > minimum_rebel_affinity for a in affinities):
+                result.append(Record([('s', props)]))
+        return result
+
+    def top_skills(self, max: int):
+        return [Record([('name', name), ('count', count)]) for name, count in self.skill_counts.most_common(max)]
+
+    def _affinities(self, person: EmbeddedPerson) -> list[tuple[str, float]]:
+        return [(c, self.characters[c]) for c in dict.fromkeys(person.associates) if c in self.characters]
+
+    def find_developers(self, req_skills: list[str], systems: list[dict], reb_affinity: float, team_size: int):
+        result = []
+        # Closest first, like the query's ORDER BY jumps
+        for system in (row['name'] for row in sorted(systems, key=lambda row: row['jumps'])):
+            for person in self.people_by_homeworld.get(system, []):
+                skills = [s for s in dict.fromkeys(person.skills) if s in req_skills]
+                associates = [(c, a) for c, a in self._affinities(person) if a is not None and a >= reb_affinity]
+                if not skills or not associates:
+                    continue
+                result.append(Record([
+                    ('name', person.name),
+                    ('homeworld', system),
+                    ('skills', skills),
+                    ('associates', [c for c, a in associates]),
+                    ('avg_affinity', sum(a for c, a in associates) / len(associates)),
+                ]))
+                if len(result) >= team_size:
+                    return result
+        return result
+
+    def system_links(self):
+        return [Record([('source', source), ('target', target)]) for source, target in self.links]
+
+    def jump_tables(self, version: str):
+        # Nothing is materialized in a snapshot, so ranking always takes distances from network.distances_from
+        return []
+
+    def rank_info(self, systems: list[dict], datetime_cutoff: str):
+        cutoff = parse_datetime(datetime_cutoff)
+        result = []
+        for row in systems:
+            system = row['name']
+            for person in self.people_by_homeworld.get(system, []):
+                if person.created is None or person.created < cutoff:
+                    continue
+                affinities = self._affinities(person)
+                skills = list(dict.fromkeys(person.skills))
+                if not skills or not affinities:
+                    continue
+                values = [a for c, a in affinities if a is not None]
+                result.append(Record([
+                    ('name', person.name),
+                    ('createdAt', person.created.strftime('%Y-%m-%dT%H:%M:%S.%fZ')),
+                    ('email', person.email),
+                    ('homeworld', system),
+                    ('associates', [c for c, a in affinities]),
+                    ('devSkills', skills),
+                    ('avg_associate_affinity', sum(values) / len(values) if values else None),
+                    ('jumpsFromBase', row['jumps']),
+                ]))
+        return result
@@ -0,0 +1,180 @@
+"""Jump distances over the hyperspace graph of System nodes and their CONNECTED_TO/NEAR links."""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# Longest hyperspace route the app considers
+MAX_JUMPS = 100
+# Jump matrix value for systems with no route within MAX_JUMPS
+UNREACHABLE = -1
+
+def graph_version(links) -> str:
+    """Changes whenever a system link is added or removed."""
+    digest = hashlib.sha1()
+    for source, target in sorted(links):
+        digest.update(f"{source}\x00{target}\n".encode())
+    return digest.hexdigest()
+
+def nearest_first(names: list[str], row: np.ndarray, max_jumps: int) -> dict:
+    # Nearest first, the order find_developers ranks developers in
+    reached = np.flatnonzero((row != UNREACHABLE) & (row <= max_jumps))
+    return {names[j]: int(row[j]) for j in reached[np.argsort(row[reached], kind='stable')]}
+
+def _write_atomic(path: str, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+class CSRGraph:
+    """Compressed sparse row adjacency: the neighbours of system i are indices[indptr[i]:indptr[i + 1]].
+
+    Breadth-first search works a whole frontier at a time with array operations, a few
+    microseconds per level for the ~2000 systems.
+    """
+    def __init__(self, names: list[str], indptr: np.ndarray, indices: np.ndarray, version: str = None):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.indptr = indptr
+        self.indices = indices
+        self.version = version
+
+    @classmethod
+    def from_links(cls, links, directed: bool = False, version: str = None) -> "CSRGraph":
+        """links are (source, target) pairs. Undirected graphs link both ways, directed ones point
+        from target to source, so a search follows links backwards to the systems that reach it."""
+        links = list(links)
+        names = sorted({n for link in links for n in link})
+        index = {name: i for i, name in enumerate(names)}
+        sources = np.array([index[s] for s, t in links], dtype=np.int32)
+        targets = np.array([index[t] for s, t in links], dtype=np.int32)
+        rows, cols = targets, sources
+        if not directed:
+            rows, cols = np.concatenate([targets, sources]), np.concatenate([sources, targets])
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        # Parallel CONNECTED_TO and NEAR links are one neighbour
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols = rows[keep], cols[keep]
+        indptr = np.zeros(len(names) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=len(names)), out=indptr[1:])
+        return cls(names, indptr, cols, version)
+
+    def bfs_row(self, i: int, max_depth: int = MAX_JUMPS) -> np.ndarray:
+        """Jumps from system i to every system, UNREACHABLE beyond max_depth."""
+        distances = np.full(len(self.names), UNREACHABLE, dtype=np.int16)
+        distances[i] = 0
+        frontier = np.array([i], dtype=np.int32)
+        depth = 0
+        while len(frontier) and depth < max_depth:
+            depth += 1
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            # Concatenated neighbour ranges of the whole frontier without a Python loop
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            neighbors = self.indices[offsets + np.arange(counts.sum())]
+            neighbors = np.unique(neighbors[distances[neighbors] == UNREACHABLE])
+            distances[neighbors] = depth
+            frontier = neighbors
+        return distances
+
+    def distances_from(self, name: str, max_depth: int = MAX_JUMPS) -> dict:
+        """System name -> jumps for every system within max_depth of name, including name itself at 0."""
+        i = self.index.get(name)
+        if i is None:
+            return {name: 0}
+        row = self.bfs_row(i, max_depth)
+        return {self.names[j]: int(row[j]) for j in np.flatnonzero(row != UNREACHABLE)}
+
+    def reachable_within(self, name: str, k: int) -> dict:
+        """System name -> jumps for the systems at most k jumps from name, nearest first."""
+        i = self.index.get(name)
+        if i is None:
+            return {name: 0}
+        return nearest_first(self.names, self.bfs_row(i, k), k)
+
+class JumpMatrix:
+    """Dense all-pairs jump counts. Row i holds the jumps from system i to every other system
+    over the adjacency the matrix was built from, UNREACHABLE when there is no route within MAX_JUMPS.
+
+    About 2000 systems fit in 8 MB as int16, loaded matrices are memory mapped rather than read.
+    """
+    def __init__(self, names: list[str], distances: np.ndarray, version: str):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.distances = distances
+        self.version = version
+
+    @classmethod
+    def build(cls, graph: CSRGraph, max_depth: int = MAX_JUMPS) -> "JumpMatrix":
+        distances = np.empty((len(graph.names), len(graph.names)), dtype=np.int16)
+        for i in range(len(graph.names)):
+            distances[i] = graph.bfs_row(i, max_depth)
+        return cls(graph.names, distances, graph.version)
+
+    def save(self, directory: str, kind: str):
+        """Writes <kind>-<version>.json then <kind>-<version>.npy and removes other versions of that kind.
+
+        A version's files never change once written, and each appears whole through os.replace of a
+        temporary file, so processes sharing the directory can't pair one version's names with another's
+        distances or overwrite each other's writes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{kind}-{self.version}")
+        _write_atomic(path + ".json", lambda f: f.write(json.dumps({'version': self.version, 'names': self.names}).encode()))
+        _write_atomic(path + ".npy", lambda f: np.save(f, self.distances))
+        for old in glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(kind)}-*")):
+            if not old.startswith(path + ".") and not old.endswith(".tmp"):
+                try:
+                    # Processes still mapping an old matrix keep reading it until they close it
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def load(cls, directory: str, kind: str, version: str) -> "JumpMatrix":
+        """The saved matrix of this kind for this graph version, None if there is none."""
+        path = os.path.join(directory, f"{kind}-{version}")
+        # The .npy is written last, so with it in place the .json is complete
+        if not os.path.exists(path + ".npy"):
+            return None
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            distances = np.load(path + ".npy", mmap_mode='r')
+        except FileNotFoundError:
+            # Removed by a newer version's save in the meantime
+            return None
+        return cls(meta['names'], distances, meta['version'])
+
+    def jumps(self, source: str, target: str) -> int:
+        """Jumps from source to target, None when out of reach."""
+        i, j = self.index.get(source), self.index.get(target)
+        if i is None or j is None:
+            return 0 if source == target else None
+        value = int(self.distances[i, j])
+        return None if value == UNREACHABLE else value
+
+    def distances_from(self, name: str) -> dict:
+        """System name -> jumps for every system within MAX_JUMPS of name, including name itself at 0."""
+        i = self.index.get(name)
+        if i is None:
+            return {name: 0}
+        row = self.distances[i]
+        reached = np.flatnonzero(row != UNREACHABLE)
+        return {self.names[j]: int(row[j]) for j in reached}
+
+    def within(self, name: str, max_jumps: int) -> dict:
+        """System name -> jumps for the systems at most max_jumps from name, nearest first."""
+        i = self.index.get(name)
+        if i is None:
+            return {name: 0}
+        return nearest_first(self.names, self.distances[i], max_jumps)
@@ -0,0 +1,75 @@
+"""UNWIND write statements for loading the network, for use with neo4j_driver.execute_batch."""
+from neo4j_driver import execute_batch, BatchResult
+
+UPSERT_SYSTEMS = """
+UNWIND $rows AS row
+MERGE (s:System {name: row.name})
+SET s.X = row.x, s.Y = row.y, s.Region = row.region, s.importance = row.importance, s.rebel_affinity = row.rebel_affinity
+"""
+
+# rows: {source, target, type} where type is CONNECTED_TO or NEAR
+UPSERT_SYSTEM_LINKS = """
+UNWIND $rows AS row
+MATCH (a:System {name: row.source})
+MATCH (b:System {name: row.target})
+FOREACH (_ IN CASE WHEN row.type = 'NEAR' THEN [1] ELSE [] END | MERGE (a)-[:NEAR]->(b))
+FOREACH (_ IN CASE WHEN row.type = 'CONNECTED_TO' THEN [1] ELSE [] END | MERGE (a)-[:CONNECTED_TO]->(b))
+"""
+
+UPSERT_TOPICS = """
+UNWIND $rows AS row
+MERGE (:Topic {name: row.name})
+"""
+
+UPSERT_CHARACTERS = """
+UNWIND $rows AS row
+MERGE (c:Character {name: row.name})
+SET c.rebel_affinity = row.rebel_affinity
+"""
+
+# rows: {name, email, created_at (ISO string), homeworld, skills: [str], associates: [str]}
+REGISTER_PEOPLE = """
+UNWIND $rows AS row
+MERGE (p:Person {email: row.email})
+ON CREATE SET p.created_at = datetime(row.created_at)
+SET p.name = row.name
+WITH p, row
+// Unit subqueries, so an unknown homeworld or no skills doesn't drop the row's other writes
+CALL {
+    WITH p, row
+    MATCH (s:System {name: row.homeworld})
+    MERGE (p)-[:FROM]->(s)
+}
+CALL {
+    WITH p, row
+    UNWIND row.skills AS skill
+    MERGE (t:Topic {name: skill})
+    MERGE (p)-[:KNOWS]->(t)
+}
+CALL {
+    WITH p, row
+    UNWIND row.associates AS associate
+    MATCH (c:Character {name: associate})
+    MERGE (p)-[:KNOWS]->(c)
+}
+"""
+
+def upsert_systems(rows, batch_size: int = None) -> BatchResult:
+    return _load(UPSERT_SYSTEMS, rows, batch_size, 'upsert_systems')
+
+def upsert_system_links(rows, batch_size: int = None) -> BatchResult:
+    return _load(UPSERT_SYSTEM_LINKS, rows, batch_size, 'upsert_system_links')
+
+def upsert_topics(rows, batch_size: int = None) -> BatchResult:
+    return _load(UPSERT_TOPICS, rows, batch_size, 'upsert_topics')
+
+def upsert_characters(rows, batch_size: int = None) -> BatchResult:
+    return _load(UPSERT_CHARACTERS, rows, batch_size, 'upsert_characters')
+
+def register_people(rows, batch_size: int = None) -> BatchResult:
+    return _load(REGISTER_PEOPLE, rows, batch_size, 'register_people')
+
+def _load(query, rows, batch_size, name):
+    if batch_size is None:
+        return execute_batch(query, rows, name=name)
+    return execute_batch(query, rows, batch_size, name=name)
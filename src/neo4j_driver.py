@@ -1,12 +1,63 @@
-from neo4j import GraphDatabase, basic_auth
-import streamlit as st
+from neo4j import GraphDatabase, AsyncGraphDatabase, Bookmarks, Query, Record, READ_ACCESS, WRITE_ACCESS, basic_auth
+from neo4j.exceptions import DriverError, Neo4jError, ServiceUnavailable, SessionExpired, TransientError
+import asyncio
+import concurrent.futures
+import itertools
 import logging
+import random
+import threading
+import time
+import weakref
+from collections import Counter
+from dataclasses import dataclass, field
+from config import secret
+from query_cache import QueryCache, cache_key
+from query_metrics import MetricsRegistry
+from circuit_breaker import BreakerRegistry, stale
+from single_flight import SingleFlight
 
-host = st.secrets['NEO4J_URI']
-user = st.secrets['NEO4J_USER']
-password = st.secrets['NEO4J_PASSWORD']
+host = secret('NEO4J_URI')
+user = secret('NEO4J_USER')
+password = secret('NEO4J_PASSWORD')
 
-driver = GraphDatabase.driver(host, auth=basic_auth(user, password))
+# Records pulled per round trip when streaming
+DEFAULT_FETCH_SIZE = int(secret('NEO4J_FETCH_SIZE', 1000))
+
+# Rows per UNWIND transaction for execute_batch
+DEFAULT_BATCH_SIZE = int(secret('NEO4J_BATCH_SIZE', 1000))
+
+# Transient error retries: exponential backoff with full jitter, bounded by an overall deadline per call
+RETRY_ATTEMPTS = int(secret('NEO4J_RETRY_ATTEMPTS', 5))
+RETRY_INITIAL_DELAY = float(secret('NEO4J_RETRY_INITIAL_DELAY', 0.2))
+RETRY_MAX_DELAY = float(secret('NEO4J_RETRY_MAX_DELAY', 5.0))
+DEFAULT_DEADLINE = float(secret('NEO4J_QUERY_DEADLINE', 30.0))
+
+# Server-side transaction timeout in seconds for queries that don't set one, see queries.py for per query values
+DEFAULT_TIMEOUT = float(secret('NEO4J_QUERY_TIMEOUT', 30.0))
+# Result cache bound. Queries are only cached when given a TTL, see queries.py
+CACHE_MAX_BYTES = int(secret('NEO4J_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Streamed results longer than this are passed through without being cached, keeping memory flat
+CACHE_MAX_STREAM_ROWS = int(secret('NEO4J_CACHE_MAX_STREAM_ROWS', 50000))
+
+# Per named query circuit breaker. After BREAKER_FAILURES consecutive timeouts or transient failures the
+# query's last good result is served (marked stale) instead, with a background retry every BREAKER_RESET seconds
+BREAKER_FAILURES = int(secret('NEO4J_BREAKER_FAILURES', 3))
+BREAKER_RESET = float(secret('NEO4J_BREAKER_RESET', 30.0))
+# Bound and maximum age of the last good results kept for open circuits
+STALE_MAX_BYTES = int(secret('NEO4J_STALE_MAX_BYTES', 32 * 1024 * 1024))
+STALE_MAX_AGE = float(secret('NEO4J_STALE_MAX_AGE', 24 * 3600.0))
+
+# How often a cancellable wait checks whether its caller has gone away
+CANCEL_POLL_INTERVAL = 0.25
+
+# Connection pool settings, all optional in secrets.toml
+MAX_POOL_SIZE = int(secret('NEO4J_MAX_POOL_SIZE', 50))
+CONNECTION_ACQUISITION_TIMEOUT = float(secret('NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 30.0))
+LIVENESS_CHECK_TIMEOUT = secret('NEO4J_LIVENESS_CHECK_TIMEOUT', 60.0)
+MAX_CONNECTION_LIFETIME = float(secret('NEO4J_MAX_CONNECTION_LIFETIME', 3600.0))
+
+# Connections per driver opened in the background when this module is first imported, 0 to skip warm-up
+WARMUP_CONNECTIONS = min(int(secret('NEO4J_WARMUP_CONNECTIONS', 4)), MAX_POOL_SIZE)
 
 # Uncomment to debug neo4j
 # handler = logging.StreamHandler(sys.stdout)
@@ -14,14 +65,667 @@ driver = GraphDatabase.driver(host, auth=basic_auth(user, password))
 # logging.getLogger("neo4j").addHandler(handler)
 # logging.getLogger("neo4j").setLevel(logging.DEBUG)
 
-def execute_query(query, params={}):
-    # print(f'host: {host}, user: {user}, password: {password}')
-    # Using experimental API
-    try:
-        with GraphDatabase.driver(host, auth=basic_auth(user, password)) as driver:
-            records, summary, keys = driver.execute_query(query, params)
-            # logging.info(f"keys: {keys}, summary: {summary}, records: {records}")
-            return records
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
\ No newline at end of file
+_driver = None
+_async_driver = None
+_loop = None
+_driver_lock = threading.Lock()
+cache = QueryCache(CACHE_MAX_BYTES)
+metrics = MetricsRegistry()
+breakers = BreakerRegistry(BREAKER_FAILURES, BREAKER_RESET)
+# Last good result per query and params, whatever its TTL, with the wall clock time it was fetched
+last_good = QueryCache(STALE_MAX_BYTES)
+# Identical queries already running, later callers wait for the same result instead of running it again
+inflight = SingleFlight()
+# Bookmarks of the latest writes. Reads pass them along, so whichever cluster member serves
+# a read waits until it has caught up with those writes
+_bookmarks = frozenset()
+_bookmarks_lock = threading.Lock()
+# Timings of the last warm_up(), see warm_up_report
+_warm_up = {}
+# Optional stand-ins for the database and a recorder of every result, see replay.py
+_backend = None
+_recorder = None
+
+def driver_config() -> dict:
+    config = {
+        'max_connection_pool_size': MAX_POOL_SIZE,
+        'connection_acquisition_timeout': CONNECTION_ACQUISITION_TIMEOUT,
+        'max_connection_lifetime': MAX_CONNECTION_LIFETIME,
+    }
+    # Idle connections older than this are pinged before being handed out
+    if LIVENESS_CHECK_TIMEOUT is not None:
+        config['liveness_check_timeout'] = float(LIVENESS_CHECK_TIMEOUT)
+    return config
+
+def get_driver():
+    """Process-wide pooled driver, shared by every Streamlit session and rerun."""
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(host, auth=basic_auth(user, password), **driver_config())
+    return _driver
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    """Background event loop the async driver lives on. Streamlit script threads have no loop of their own."""
+    global _loop
+    if _loop is None:
+        with _driver_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="neo4j-async", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def get_async_driver():
+    """Pooled async driver. Only use it from coroutines running on event_loop()."""
+    global _async_driver
+    if _async_driver is None:
+        _async_driver = AsyncGraphDatabase.driver(host, auth=basic_auth(user, password), **driver_config())
+    return _async_driver
+
+def read_bookmarks() -> Bookmarks:
+    return Bookmarks.from_raw_values(_bookmarks)
+
+def _update_bookmarks(previous: Bookmarks, latest: Bookmarks):
+    # A write's bookmarks already imply the ones it started from, same as the driver's BookmarkManager
+    global _bookmarks
+    with _bookmarks_lock:
+        _bookmarks = (_bookmarks - previous.raw_values) | latest.raw_values
+
+def read_session(driver, **config):
+    """A session for reads. READ access lets a routing (neo4j://) driver send them to any
+    secondary or read replica, on a single instance it makes no difference."""
+    return driver.session(default_access_mode=READ_ACCESS, bookmarks=read_bookmarks(), **config)
+
+def set_backend(backend):
+    """Serves queries from backend.run(query, params, name) instead of Neo4j. None restores Neo4j."""
+    global _backend
+    _backend = backend
+    cache.invalidate()
+    last_good.invalidate()
+    breakers.reset()
+
+def uses_database() -> bool:
+    """False when queries are served by a backend (embedded graph, replay) rather than Neo4j."""
+    return _backend is None
+
+def set_recorder(recorder):
+    """Passes every query's results to recorder.record(query, params, name, records, seconds). None stops recording."""
+    global _recorder
+    _recorder = recorder
+
+def _observe(query, params, name, started, result, summary=None):
+    seconds = time.perf_counter() - started
+    metrics.record(name, seconds, row_count(result), summary)
+    if _recorder is not None:
+        if isinstance(result, dict):
+            result = [Record(zip(result.keys(), row)) for row in zip(*result.values())]
+        _recorder.record(query, params, name, result, seconds)
+
+def _from_backend(query, params, name, columnar=False):
+    try:
+        records = _backend.run(query, params, name)
+    except LookupError as e:
+        raise QueryError(str(e)) from e
+    return to_columns(records) if columnar else records
+
+def close_driver():
+    global _driver, _async_driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+        if _async_driver is not None and _loop is not None:
+            asyncio.run_coroutine_threadsafe(_async_driver.close(), _loop).result()
+            _async_driver = None
+
+class QueryError(Exception):
+    """A query failed in a way retrying won't fix, e.g. a syntax error or a constraint violation."""
+
+class TransientQueryError(QueryError):
+    """A query kept failing with transient errors (leader election, unavailable server) until retries ran out."""
+
+class QueryDeadlineExceeded(TransientQueryError):
+    """A query's transient failures outlasted its deadline."""
+
+class QueryTimeoutError(QueryError):
+    """A query ran longer than its timeout and was terminated."""
+
+class CircuitOpenError(TransientQueryError):
+    """A query's circuit is open and there is no earlier result to serve instead."""
+
+def is_timeout(error: Exception) -> bool:
+    return 'TransactionTimedOut' in (getattr(error, 'code', None) or '')
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, (ServiceUnavailable, SessionExpired, TransientError)):
+        return True
+    is_retryable = getattr(error, 'is_retryable', None)
+    return bool(is_retryable is not None and is_retryable())
+
+def typed_error(error: Exception, message: str = None) -> QueryError:
+    message = message or str(error)
+    if is_timeout(error):
+        return QueryTimeoutError(message)
+    return TransientQueryError(message) if is_transient(error) else QueryError(message)
+
+def _retry_delay(error: Exception, attempt: int, started: float, deadline: float) -> float:
+    """Seconds to wait before the next attempt, or raises the typed error if the query should give up."""
+    if not is_transient(error):
+        raise typed_error(error) from error
+    if attempt >= RETRY_ATTEMPTS:
+        raise TransientQueryError(f"Gave up after {attempt} attempts: {error}") from error
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** (attempt - 1)))
+    if time.monotonic() + delay - started >= deadline:
+        raise QueryDeadlineExceeded(f"Deadline of {deadline}s exceeded after {attempt} attempts: {error}") from error
+    logging.warning(f"Transient error on attempt {attempt}, retrying in {delay:.2f}s: {error}")
+    return delay
+
+def with_retries(fn, deadline: float = DEFAULT_DEADLINE):
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn()
+        except (Neo4jError, DriverError) as e:
+            time.sleep(_retry_delay(e, attempt, started, deadline))
+
+async def with_retries_async(fn, deadline: float = DEFAULT_DEADLINE):
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return await fn()
+        except (Neo4jError, DriverError) as e:
+            await asyncio.sleep(_retry_delay(e, attempt, started, deadline))
+
+def query_timeout(timeout: float = None) -> float:
+    return DEFAULT_TIMEOUT if timeout is None else timeout
+
+def _query(query, name: str = None, timeout: float = None) -> Query:
+    # The name shows up in SHOW TRANSACTIONS and the query log
+    metadata = {'app': 'rebel-developer-network', 'query': name} if name else None
+    return Query(query, metadata=metadata, timeout=query_timeout(timeout))
+
+def invalidate_cache(names: list[str] = None) -> int:
+    """Drops cached results for the named queries, or all of them. Writes call this so reads see their changes."""
+    return cache.invalidate(names)
+
+def cache_stats() -> dict:
+    return cache.stats()
+
+def query_metrics() -> dict:
+    """Calls, rows, latency percentiles and server timings per named query, busiest first."""
+    return metrics.snapshot()
+
+def breaker_status() -> dict:
+    """Circuit state, consecutive failures and times opened per named query."""
+    return breakers.snapshot()
+
+def _result_key(query, params, columnar=False) -> str:
+    return cache_key(query, params) + ("\ncolumns" if columnar else "")
+
+def _flight_key(query, params, columnar=False) -> str:
+    # A read started after a write mustn't share a result that may predate it
+    return _result_key(query, params, columnar) + "\n" + ",".join(sorted(_bookmarks))
+
+def _cache_lookup(query, params, name, ttl, columnar=False):
+    """Returns (key, ttl, cached result). key is None when the query isn't cacheable."""
+    ttl = ttl or 0.0
+    if ttl <= 0:
+        return None, ttl, None
+    key = _result_key(query, params, columnar) + f"\n{cache.generation(name)}"
+    return key, ttl, cache.get(key)
+
+def _failed(name, error: QueryError):
+    metrics.record_error(name)
+    # A bad query isn't the database's fault, only timeouts and unavailability count against the circuit
+    if name is not None and isinstance(error, (TransientQueryError, QueryTimeoutError)):
+        breakers.failure(name)
+
+def _succeeded(query, params, name, started, result, summary, key, ttl, columnar):
+    _observe(query, params, name, started, result, summary)
+    if key is not None:
+        cache.put(key, result, ttl, name)
+    if name is not None:
+        breakers.success(name)
+        last_good.put(_result_key(query, params, columnar), (result, time.time()), STALE_MAX_AGE, name)
+
+def _short_circuit(query, params, name, timeout, deadline, key, ttl, columnar):
+    """The last good result, marked stale, while the named query's circuit is open. None when the query should run.
+
+    Once a retry is due it runs in the background and the caller still gets the stale result,
+    so no caller waits on a database that has been failing. Raises CircuitOpenError when the
+    circuit is open and there is no earlier result to fall back on.
+    """
+    if name is None or breakers.is_closed(name):
+        return None
+    stored = last_good.get(_result_key(query, params, columnar))
+    trial = breakers.try_trial(name)
+    if stored is None:
+        if trial:
+            return None
+        raise CircuitOpenError(f"Query '{name}' keeps failing, retrying in the background")
+    if trial:
+        asyncio.run_coroutine_threadsafe(_fetch_async(query, params, name, timeout, deadline, key, ttl, columnar), event_loop())
+    metrics.record_stale_hit(name)
+    return stale(*stored)
+
+def _append_columns(columns: list[list], batch: list):
+    # Records are tuples, transposing a batch avoids a keyed lookup per row and value
+    for column, values in zip(columns, zip(*batch)):
+        column.extend(values)
+
+def to_columns(records: list) -> dict:
+    """Column name -> list of values, the columnar form of a list of records."""
+    keys = list(records[0].keys()) if records else []
+    columns = [[] for _ in keys]
+    _append_columns(columns, records)
+    return dict(zip(keys, columns))
+
+def row_count(result) -> int:
+    if isinstance(result, dict):
+        return len(next(iter(result.values()), []))
+    return len(result)
+
+def wait_for(future: concurrent.futures.Future, cancel_check=None):
+    """Waits for a future from event_loop(), cancelling it if cancel_check raises.
+
+    cancel_check is called every CANCEL_POLL_INTERVAL seconds while waiting. Whatever it raises
+    (e.g. Streamlit's rerun exception) cancels the query, which closes its connection so the
+    server stops working on it, and is then re-raised.
+    """
+    if cancel_check is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=CANCEL_POLL_INTERVAL)
+        except concurrent.futures.TimeoutError:
+            try:
+                cancel_check()
+            except BaseException:
+                future.cancel()
+                raise
+
+def _run_query(query, params, name, timeout, columnar=False):
+    with read_session(get_driver()) as session:
+        result = session.run(_query(query, name, timeout), params)
+        keys = result.keys()
+        if not columnar:
+            records = list(result)
+            return records, result.consume(), keys
+        columns = [[] for _ in keys]
+        while batch := result.fetch(DEFAULT_FETCH_SIZE):
+            _append_columns(columns, batch)
+        return dict(zip(keys, columns)), result.consume(), keys
+
+async def _run_query_async(query, params, name, timeout, columnar=False):
+    async with read_session(get_async_driver()) as session:
+        result = await session.run(_query(query, name, timeout), params)
+        keys = result.keys()
+        if not columnar:
+            records = [record async for record in result]
+            return records, await result.consume(), keys
+        columns = [[] for _ in keys]
+        while batch := await result.fetch(DEFAULT_FETCH_SIZE):
+            _append_columns(columns, batch)
+        return dict(zip(keys, columns)), await result.consume(), keys
+
+def execute_query(query, params={}, name: str = None, timeout: float = None, deadline: float = DEFAULT_DEADLINE, cancel_check=None, ttl: float = None, columnar: bool = False):
+    """Runs a read query and returns its records.
+
+    With columnar the result is instead a dict of column name -> list of values, built batch by
+    batch while the result is consumed, without keeping the records or looking up values by key.
+
+    Results are cached for ttl seconds when given. The server terminates the query after
+    timeout seconds, DEFAULT_TIMEOUT if not given. name labels the query in metrics and server logs.
+    Transient errors are retried with backoff until deadline seconds have passed. Raises QueryError,
+    QueryTimeoutError, or TransientQueryError/QueryDeadlineExceeded when the database stayed unavailable.
+    Pass cancel_check to make the wait cancellable, see wait_for.
+
+    Identical queries (same text, params and columnar) that are already running aren't run again,
+    callers wait for the running one and all get the same result object, so don't modify it.
+
+    After repeated timeouts or transient failures a named query's circuit opens, and its last
+    good result is returned instead, see circuit_breaker.stale_age and _short_circuit.
+    """
+    if cancel_check is not None:
+        return wait_for(submit_query(query, params, name, timeout, deadline, ttl, columnar), cancel_check)
+    key, ttl, cached = _cache_lookup(query, params, name, ttl, columnar)
+    if cached is not None:
+        metrics.record_cache_hit(name)
+        return cached
+    stale_result = _short_circuit(query, params, name, timeout, deadline, key, ttl, columnar)
+    if stale_result is not None:
+        return stale_result
+    flight_key = _flight_key(query, params, columnar)
+    flight, leader = inflight.join(flight_key)
+    if not leader:
+        metrics.record_coalesced(name)
+        return flight.future.result()
+    try:
+        records = _fetch(query, params, name, timeout, deadline, key, ttl, columnar)
+    except BaseException as e:
+        inflight.settle(flight_key, flight, error=e)
+        raise
+    inflight.settle(flight_key, flight, records)
+    return records
+
+def _fetch(query, params, name, timeout, deadline, key, ttl, columnar):
+    started = time.perf_counter()
+    try:
+        if _backend is not None:
+            records, summary = _from_backend(query, params, name, columnar), None
+        else:
+            records, summary, keys = with_retries(lambda: _run_query(query, params, name, timeout, columnar), deadline)
+    except QueryError as e:
+        _failed(name, e)
+        raise
+    # logging.info(f"keys: {keys}, summary: {summary}, records: {records}")
+    _succeeded(query, params, name, started, records, summary, key, ttl, columnar)
+    return records
+
+def profile_query(query, params={}, name: str = None, timeout: float = None, explain: bool = False):
+    """Runs the query under PROFILE (or EXPLAIN, which plans without executing) and returns the plan.
+
+    Bypasses the result cache. The plan is the summary's profile dict, or plan dict for EXPLAIN,
+    with operatorType, args (EstimatedRows, ...), identifiers, children and, for PROFILE, dbHits and rows.
+    """
+    prefix = "EXPLAIN " if explain else "PROFILE "
+    records, summary, keys = with_retries(lambda: _run_query(prefix + query.lstrip(), params, name, timeout))
+    return summary.plan if explain else summary.profile
+
+async def execute_query_async(query, params={}, name: str = None, timeout: float = None, deadline: float = DEFAULT_DEADLINE, ttl: float = None, columnar: bool = False):
+    key, ttl, cached = _cache_lookup(query, params, name, ttl, columnar)
+    if cached is not None:
+        metrics.record_cache_hit(name)
+        return cached
+    stale_result = _short_circuit(query, params, name, timeout, deadline, key, ttl, columnar)
+    if stale_result is not None:
+        return stale_result
+    flight_key = _flight_key(query, params, columnar)
+    flight, leader = inflight.join(flight_key)
+    if leader:
+        # The query runs as its own task, so one caller being cancelled doesn't fail the others
+        flight.task = asyncio.ensure_future(_fetch_async(query, params, name, timeout, deadline, key, ttl, columnar))
+        flight.task.add_done_callback(lambda task: inflight.settle_from(flight_key, flight, task))
+    else:
+        metrics.record_coalesced(name)
+    try:
+        return await asyncio.shield(asyncio.wrap_future(flight.future))
+    except asyncio.CancelledError:
+        # The last caller to give up cancels the query itself
+        if inflight.leave(flight_key, flight) and flight.task is not None:
+            flight.task.get_loop().call_soon_threadsafe(flight.task.cancel)
+        raise
+
+async def _fetch_async(query, params, name, timeout, deadline, key, ttl, columnar):
+    started = time.perf_counter()
+    try:
+        if _backend is not None:
+            records, summary = await asyncio.to_thread(_from_backend, query, params, name, columnar), None
+        else:
+            records, summary, keys = await with_retries_async(lambda: _run_query_async(query, params, name, timeout, columnar), deadline)
+    except QueryError as e:
+        _failed(name, e)
+        raise
+    _succeeded(query, params, name, started, records, summary, key, ttl, columnar)
+    return records
+
+def submit_query(query, params={}, name: str = None, timeout: float = None, deadline: float = DEFAULT_DEADLINE, ttl: float = None, columnar: bool = False) -> concurrent.futures.Future:
+    """Starts a query on the async driver without waiting for it. Call .result() on the returned future for the records."""
+    return asyncio.run_coroutine_threadsafe(execute_query_async(query, params, name, timeout, deadline, ttl, columnar), event_loop())
+
+def _close_session(session, loop: asyncio.AbstractEventLoop):
+    # Don't block here, this can run from garbage collection
+    asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+def stream_query(query, params={}, fetch_size: int = DEFAULT_FETCH_SIZE, name: str = None, timeout: float = None, cancel_check=None, ttl: float = None):
+    """Runs the query now and returns a generator of records pulled from the server fetch_size at a time.
+
+    Only one batch of records is held in memory at once. The underlying session and its pooled
+    connection are held until the generator is exhausted, closed or garbage collected, even if
+    it was never iterated. Every wait on the server, including for later batches, can be
+    cancelled through cancel_check.
+
+    Fully consumed results of up to CACHE_MAX_STREAM_ROWS records are cached like execute_query's.
+    """
+    key, ttl, cached = _cache_lookup(query, params, name, ttl)
+    if cached is not None:
+        metrics.record_cache_hit(name)
+        return iter(cached)
+    started = time.perf_counter()
+    if _backend is not None:
+        try:
+            records = _from_backend(query, params, name)
+        except QueryError:
+            metrics.record_error(name)
+            raise
+        _observe(query, params, name, started, records)
+        if key is not None:
+            cache.put(key, records, ttl, name)
+        return iter(records)
+    loop = event_loop()
+
+    async def start():
+        session = read_session(get_async_driver(), fetch_size=fetch_size)
+        try:
+            return session, await session.run(_query(query, name, timeout), params)
+        except BaseException:
+            await session.close()
+            raise
+    # Only the initial run is retried, once records have been yielded a retry would repeat them
+    try:
+        session, result = wait_for(asyncio.run_coroutine_threadsafe(with_retries_async(start), loop), cancel_check)
+    except QueryError:
+        metrics.record_error(name)
+        raise
+
+    def records():
+        seen = [] if key is not None else None
+        recorded = [] if _recorder is not None else None
+        rows = 0
+        try:
+            while True:
+                batch = wait_for(asyncio.run_coroutine_threadsafe(result.fetch(fetch_size), loop), cancel_check)
+                if not batch:
+                    break
+                rows += len(batch)
+                if recorded is not None:
+                    recorded.extend(batch)
+                if seen is not None:
+                    seen.extend(batch)
+                    if len(seen) > CACHE_MAX_STREAM_ROWS:
+                        seen = None
+                yield from batch
+            summary = wait_for(asyncio.run_coroutine_threadsafe(result.consume(), loop), cancel_check)
+            metrics.record(name, time.perf_counter() - started, rows, summary)
+            if recorded is not None:
+                _recorder.record(query, params, name, recorded, time.perf_counter() - started)
+            if seen is not None:
+                cache.put(key, seen, ttl, name)
+        except (Neo4jError, DriverError) as e:
+            metrics.record_error(name)
+            raise typed_error(e) from e
+        finally:
+            close()
+    stream = records()
+    # The generator's finally only runs once it has started, this also covers one dropped unstarted
+    close = weakref.finalize(stream, _close_session, session, loop)
+    return stream
+
+@dataclass
+class BatchResult:
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    counters: Counter = field(default_factory=Counter)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+WRITE_COUNTERS = [
+    'nodes_created',
+    'nodes_deleted',
+    'relationships_created',
+    'relationships_deleted',
+    'properties_set',
+    'labels_added',
+]
+
+def _write_batch(tx, query, rows):
+    result = tx.run(query, rows=rows)
+    return result.consume()
+
+def _write_batches(query, rows, batch_size, report, name):
+    previous = read_bookmarks()
+    with get_driver().session(default_access_mode=WRITE_ACCESS, bookmarks=previous) as session:
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                # Managed transactions already retry transient errors, only classify what gets through
+                batch_started = time.perf_counter()
+                try:
+                    summary = session.execute_write(_write_batch, query, batch)
+                except (Neo4jError, DriverError) as e:
+                    metrics.record_error(name)
+                    raise typed_error(e, f"Batch {report.batches + 1} failed after {report.rows} rows: {e}") from e
+                metrics.record(name, time.perf_counter() - batch_started, len(batch), summary)
+                report.rows += len(batch)
+                report.batches += 1
+                for counter in WRITE_COUNTERS:
+                    report.counters[counter] += getattr(summary.counters, counter, 0)
+        finally:
+            # Batches committed before a failure are visible to later reads too
+            _update_bookmarks(previous, session.last_bookmarks())
+
+def execute_batch(query, rows, batch_size: int = DEFAULT_BATCH_SIZE, invalidates: list[str] = None, name: str = 'batch_write') -> BatchResult:
+    """Writes rows in chunks of batch_size, one managed write transaction per chunk.
+
+    The query receives each chunk as $rows, so it should start with `UNWIND $rows AS row`.
+    Reads started after this returns see the write, whichever cluster member serves them.
+    rows can be any iterable, including a generator, and is only read one chunk at a time.
+    Cached results for the invalidates query names, or all cached results by default, are
+    dropped afterwards, even if a batch failed part way.
+    """
+    report = BatchResult()
+    start = time.perf_counter()
+    try:
+        _write_batches(query, iter(rows), batch_size, report, name)
+    finally:
+        invalidate_cache(invalidates)
+    report.seconds = time.perf_counter() - start
+    logging.info(f"execute_batch: {report.rows} rows in {report.batches} batches, {report.seconds:.2f}s ({report.rows_per_second:.0f} rows/s)")
+    return report
+
+def _hold_connection(driver, barrier: threading.Barrier):
+    # An open transaction keeps its connection checked out, so every thread ends up with its own.
+    # READ access, so on a cluster the pool warmed is the readers' that read_session uses
+    try:
+        with driver.session(default_access_mode=READ_ACCESS) as session:
+            with session.begin_transaction() as tx:
+                tx.run("RETURN 1").consume()
+                barrier.wait()
+    except threading.BrokenBarrierError:
+        raise
+    except BaseException:
+        # Otherwise the holders already waiting keep their transactions open for good
+        barrier.abort()
+        raise
+
+async def _hold_connection_async(barrier: asyncio.Barrier):
+    try:
+        async with get_async_driver().session(default_access_mode=READ_ACCESS) as session:
+            async with await session.begin_transaction() as tx:
+                await (await tx.run("RETURN 1")).consume()
+                await asyncio.wait_for(barrier.wait(), CONNECTION_ACQUISITION_TIMEOUT)
+    except asyncio.BrokenBarrierError:
+        raise
+    except BaseException:
+        await barrier.abort()
+        raise
+
+def _raise_warm_up_failure(errors: list, connections: int):
+    """Raises the error that broke the barrier rather than the BrokenBarrierError of every holder waiting on it."""
+    errors = [e for e in errors if e is not None]
+    if not errors:
+        return
+    broken = (threading.BrokenBarrierError, asyncio.BrokenBarrierError)
+    error = next((e for e in errors if not isinstance(e, broken)), errors[0])
+    if isinstance(error, broken + (asyncio.TimeoutError,)):
+        raise TransientQueryError(f"Warm-up failed: {connections} connections weren't all open within {CONNECTION_ACQUISITION_TIMEOUT}s") from error
+    raise error
+
+async def _warm_up_async(connections: int):
+    await get_async_driver().verify_connectivity()
+    if connections > 0:
+        barrier = asyncio.Barrier(connections)
+        results = await asyncio.gather(*(_hold_connection_async(barrier) for _ in range(connections)), return_exceptions=True)
+        _raise_warm_up_failure(results, connections)
+
+def warm_up(connections: int = WARMUP_CONNECTIONS) -> dict:
+    """Creates both drivers, verifies connectivity (which also fetches the routing table for
+    neo4j:// URIs) and opens that many pooled connections on each, so the first page view
+    doesn't pay for TLS handshakes and authentication. Returns the seconds each step took.
+    """
+    report = {'connections': connections}
+    started = time.perf_counter()
+    try:
+        driver = get_driver()
+        report['driver_seconds'] = time.perf_counter() - started
+        step = time.perf_counter()
+        driver.verify_connectivity()
+        report['connectivity_seconds'] = time.perf_counter() - step
+        step = time.perf_counter()
+        if connections > 0:
+            barrier = threading.Barrier(connections, timeout=CONNECTION_ACQUISITION_TIMEOUT)
+            with concurrent.futures.ThreadPoolExecutor(connections) as pool:
+                futures = [pool.submit(_hold_connection, driver, barrier) for _ in range(connections)]
+            _raise_warm_up_failure([future.exception() for future in futures], connections)
+        report['pool_seconds'] = time.perf_counter() - step
+        step = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(_warm_up_async(connections), event_loop()).result()
+        report['async_pool_seconds'] = time.perf_counter() - step
+    except (Neo4jError, DriverError) as e:
+        raise typed_error(e, f"Warm-up failed: {e}") from e
+    finally:
+        report['seconds'] = time.perf_counter() - started
+        _warm_up.clear()
+        _warm_up.update(report)
+    logging.info(f"warm_up: {connections} connections per driver in {report['seconds']:.2f}s")
+    return report
+
+def warm_up_report() -> dict:
+    """Timings of the last warm-up, empty if none has finished."""
+    return dict(_warm_up)
+
+def start_warm_up():
+    """Runs warm_up on a background thread, so importing this module never waits on the database."""
+    def run():
+        try:
+            warm_up()
+        except QueryError as e:
+            logging.warning(str(e))
+    threading.Thread(target=run, name="neo4j-warm-up", daemon=True).start()
+
+def configure_backend():
+    """Picks the backend from secrets: the embedded graph when NEO4J_BACKEND is "embedded",
+    replay when NEO4J_REPLAY_PATH is set, otherwise Neo4j, recording if NEO4J_RECORD_PATH is set."""
+    import replay
+    if secret('NEO4J_BACKEND') == 'embedded':
+        from embedded_graph import EmbeddedGraph
+        set_backend(EmbeddedGraph.load(secret('EMBEDDED_GRAPH_PATH')))
+    elif secret('NEO4J_REPLAY_PATH'):
+        set_backend(replay.ReplayBackend(secret('NEO4J_REPLAY_PATH'), float(secret('NEO4J_REPLAY_LATENCY_SCALE', 0.0))))
+    elif secret('NEO4J_RECORD_PATH'):
+        set_recorder(replay.Recorder(secret('NEO4J_RECORD_PATH')))
+
+configure_backend()
+if uses_database() and WARMUP_CONNECTIONS > 0:
+    start_warm_up()
@@ -0,0 +1,336 @@
+"""The app's data functions: queries by name, records to models, and ranking. No UI, safe to import from scripts."""
+from models import Person, System
+from config import secret, REPO_DIR
+from hyperspace import CSRGraph, JumpMatrix, graph_version
+from circuit_breaker import keep_stale
+import queries
+import heapq
+import datetime
+import logging
+import os
+import threading
+
+# Where jump matrices are persisted, one per adjacency kind, see hyperspace.JumpMatrix
+HYPERSPACE_DIR = secret('HYPERSPACE_DIR', os.path.join(REPO_DIR, 'snapshots', 'hyperspace'))
+
+# Database backed functions are cached inside neo4j_driver (TTLs in queries.py), where writes can invalidate them
+
+def possible_rebel_systems(minimum_rebel_affinity: float= 0.5):
+    systems = queries.run('rebel_systems', {'minimum_rebel_affinity': minimum_rebel_affinity})
+    result = []
+    for r in systems:
+        s = r.get('s')
+        new_system = (System(
+            name=s.get('name', None), 
+            x=s.get('X', None), 
+            y=s.get('Y', None), 
+            region=s.get('Region', None), 
+            type='Rebel System', 
+            importance=s.get('importance', None),
+            rebel_affinity=s.get('rebel_affinity', None)))
+        result.append(new_system)
+    return keep_stale(systems, result)
+
+def possible_rebel_system_names(minimum_rebel_affinity: float= 0.5):
+    systems = possible_rebel_systems(minimum_rebel_affinity)
+    names = [s.name for s in systems]
+    return keep_stale(systems, names)
+    
+def affinity_as_float(affinity:str)-> float:
+    if affinity == "Imperial":
+        return 0.0
+    elif affinity == "Imperial Sympathetic":
+        return 0.25
+    elif affinity == "Neutral":
+        return 0.5
+    elif affinity == "Rebel Sympathetic":
+        return 0.75
+    else:
+        return 1.0
+
+
+LANGUAGE_KEY = "Language"
+COUNT_KEY = "Developers who know"
+
+def top_skills_from_records(records):
+    result = []
+    for r in records:
+        result.append(
+            {
+                LANGUAGE_KEY: r.get('name'),
+                COUNT_KEY: r.get('count')
+            }
+        )
+    return result
+
+def get_current_top_skills(max: int = 10):
+    records = queries.run('top_skills', {'max': max})
+    return top_skills_from_records(records)
+
+def find_developers(
+    team_size: int,
+    req_skills: list[str],
+    base: str,
+    distance: int,
+    reb_affinity: float
+) -> list[str]:
+    
+    params = {
+        'req_skills': req_skills,
+        'systems': queries.systems_param(reachable_within(base, distance)),
+        'reb_affinity': reb_affinity,
+        'team_size': team_size
+    }
+    records = queries.run('find_developers', params)
+    
+    result = []
+    for r in records:
+        result.append({
+            'name': r.get('name'),
+            'homeworld': r.get('homeworld'),
+            'skills': r.get('skills'),
+            'associates': r.get('associates'),
+            'affinity': r.get('avg_affinity')
+        })
+    return keep_stale(records, result)
+
+def parse_created_at(created_at_string: str) -> datetime.datetime:
+    return datetime.datetime.strptime(created_at_string, '%Y-%m-%dT%H:%M:%S.%fZ')
+    # Below fails in streamlit cloud (using an older version of Python currently?)
+    # return datetime.datetime.fromisoformat(created_at_string) 
+
+def dev_from_columns(columns: dict, i: int) -> Person:
+    return Person(
+        name=columns['name'][i],
+        homeworld=columns['homeworld'][i],
+        created_at=parse_created_at(columns['createdAt'][i]),
+        skills=columns['devSkills'][i],
+        associates=columns['associates'][i],
+        avg_associate_affinity=columns['avg_associate_affinity'][i],
+        jumps_from_base=columns['jumpsFromBase'][i])
+
+# Snapshot of the system_links records as CSR graphs. Rebuilt when the cached records change,
+# so at most every system_links TTL (see queries.py)
+_hyperspace = {'records': None}
+# Adjacency kind -> JumpMatrix, the (kind, version) matrices being built in the background,
+# and those whose build failed, which aren't retried until the links change
+_matrices = {}
+_building = set()
+_build_failed = set()
+_matrix_lock = threading.Lock()
+
+def hyperspace() -> dict:
+    """Graph version plus undirected and incoming (target -> sources) CSRGraphs of the current system links."""
+    global _hyperspace
+    records = queries.run('system_links')
+    if records is not _hyperspace['records']:
+        links = [(r.get('source'), r.get('target')) for r in records]
+        version = graph_version(links)
+        if version == _hyperspace.get('version'):
+            _hyperspace = {**_hyperspace, 'records': records}
+        else:
+            _hyperspace = {
+                'records': records,
+                'version': version,
+                'undirected': CSRGraph.from_links(links, version=version),
+                'incoming': CSRGraph.from_links(links, directed=True, version=version),
+            }
+    return _hyperspace
+
+def _build_matrix(kind: str, graph: dict):
+    try:
+        matrix = JumpMatrix.build(graph[kind])
+        _matrices[kind] = matrix
+        logging.info(f"Built {kind} jump matrix for {len(matrix.names)} systems")
+    except Exception as e:
+        logging.warning(f"Building the {kind} jump matrix failed: {e}")
+        with _matrix_lock:
+            _build_failed.add((kind, graph['version']))
+            _building.discard((kind, graph['version']))
+        return
+    try:
+        matrix.save(HYPERSPACE_DIR, kind)
+        # Memory mapped from the file, rather than a private copy per process
+        _matrices[kind] = JumpMatrix.load(HYPERSPACE_DIR, kind, graph['version']) or matrix
+    except OSError as e:
+        # e.g. a read-only HYPERSPACE_DIR, the matrix is then only kept in this process
+        logging.warning(f"Saving the {kind} jump matrix to {HYPERSPACE_DIR} failed: {e}")
+    finally:
+        with _matrix_lock:
+            _building.discard((kind, graph['version']))
+
+def jump_matrix(kind: str) -> JumpMatrix:
+    """The jump matrix for the current links, None while it is (re)built in the background or if building it failed.
+
+    kind is 'undirected', or 'incoming' where a row holds the jumps from every system to that one.
+    """
+    graph = hyperspace()
+    matrix = _matrices.get(kind)
+    if matrix is not None and matrix.version == graph['version']:
+        return matrix
+    matrix = JumpMatrix.load(HYPERSPACE_DIR, kind, graph['version'])
+    if matrix is not None:
+        _matrices[kind] = matrix
+        return matrix
+    with _matrix_lock:
+        if (kind, graph['version']) in _building or (kind, graph['version']) in _build_failed:
+            return None
+        _building.add((kind, graph['version']))
+    threading.Thread(target=_build_matrix, args=(kind, graph), name=f"jump-matrix-{kind}", daemon=True).start()
+    return None
+
+def distances_from(base: str) -> dict:
+    """Jumps from base to every system within reach. A row of the jump matrix, or one vectorized BFS until it is built."""
+    matrix = jump_matrix('undirected')
+    if matrix is not None:
+        return matrix.distances_from(base)
+    return hyperspace()['undirected'].distances_from(base)
+
+def reachable_within(base: str, k: int) -> dict:
+    """System name -> jumps for the systems with a route of at most k jumps to base, following link direction."""
+    matrix = jump_matrix('incoming')
+    if matrix is not None:
+        return matrix.within(base, k)
+    return hyperspace()['incoming'].reachable_within(base, k)
+
+def rank_info_params(base: str, cutoff_datetime: datetime) -> dict:
+    return queries.rank_info_params(distances_from(base), cutoff_datetime)
+
+def materialized_bases(version: str) -> set[str]:
+    """Bases distance_table.py has written jump distances for, for this graph version."""
+    return {r.get('base') for r in queries.run('jump_tables', {'version': version})}
+
+def rank_query(base: str, cutoff_datetime: datetime) -> tuple[str, dict]:
+    """Name and params of the rank query for base. Reads the materialized jump distances when
+    they are written for the current graph, otherwise passes distances computed here."""
+    version = hyperspace()['version']
+    if base in materialized_bases(version):
+        return 'rank_info_materialized', queries.rank_info_materialized_params(base, version, cutoff_datetime)
+    return 'rank_info', rank_info_params(base, cutoff_datetime)
+
+def devs_with_rank_info(
+    base: str,
+    cutoff_datetime: datetime
+):
+    columns = queries.run(*rank_query(base, cutoff_datetime), columnar=True)
+    return [dev_from_columns(columns, i) for i in range(len(columns.get('name', [])))]
+
+def rank_score(
+    dev_skills: list[str],
+    avg_associate_affinity: float,
+    jumps_from_base: int,
+    skills: list[str],
+    skills_points_per: float,
+    associate_rebel_affinity: float,
+    associate_rebel_affinity_points_per: float,
+    max_distance_points: float,
+    distance_decay_per_jump: float
+) -> tuple[float, int]:
+    """Returns (ranking score, number of matching skills)."""
+    dev_score = 0.0
+    skill_points = 0.0
+    affinity_points = 0.0
+    distance_points = 0.0
+    matching_skills = 0
+    for skill in skills:
+        if skill in dev_skills:
+            skill_points += skills_points_per
+            matching_skills += 1
+    if avg_associate_affinity is None or avg_associate_affinity < associate_rebel_affinity:
+        affinity_points = 0
+    else:
+        affinity_points = associate_rebel_affinity_points_per * avg_associate_affinity
+    distance_points =  max_distance_points - distance_decay_per_jump * jumps_from_base
+    if distance_points < 0:
+        distance_points = 0
+
+    dev_score += skill_points
+    dev_score += affinity_points
+    dev_score += distance_points
+    return dev_score, matching_skills
+
+def score_dev(
+    dev: Person,
+    skills: list[str],
+    skills_points_per: float,
+    associate_rebel_affinity: float,
+    associate_rebel_affinity_points_per: float,
+    max_distance_points: float,
+    distance_decay_per_jump: float
+) -> Person:
+    dev.ranking_score, dev.matching_skills = rank_score(
+        dev.skills,
+        dev.avg_associate_affinity,
+        dev.jumps_from_base,
+        skills,
+        skills_points_per,
+        associate_rebel_affinity,
+        associate_rebel_affinity_points_per,
+        max_distance_points,
+        distance_decay_per_jump)
+    return dev
+
+def devs_ranked(
+    devs: list[Person],
+    skills: list[str],
+    skills_points_per: float,
+    associate_rebel_affinity: float,
+    associate_rebel_affinity_points_per: float,
+    max_distance_points: float,
+    distance_decay_per_jump: float,
+    limit: int = None
+):
+    """Scores devs as they arrive. With a limit only the top scorers are kept, so memory stays flat for large networks."""
+    def scored():
+        for dev in devs:
+            yield score_dev(
+                dev,
+                skills,
+                skills_points_per,
+                associate_rebel_affinity,
+                associate_rebel_affinity_points_per,
+                max_distance_points,
+                distance_decay_per_jump)
+
+    # Return list of devs ranked
+    if limit is not None:
+        return heapq.nlargest(limit, scored(), key=lambda x: x.ranking_score)
+    return sorted(scored(), key=lambda x: x.ranking_score, reverse=True)
+
+def devs_ranked_from_columns(
+    columns: dict,
+    skills: list[str],
+    skills_points_per: float,
+    associate_rebel_affinity: float,
+    associate_rebel_affinity_points_per: float,
+    max_distance_points: float,
+    distance_decay_per_jump: float,
+    limit: int = None
+):
+    """devs_ranked for a columnar rank_info result. Scores straight from the column lists, only devs that make the cut become Person objects."""
+    dev_skills = columns.get('devSkills', [])
+    affinities = columns.get('avg_associate_affinity', [])
+    jumps = columns.get('jumpsFromBase', [])
+    scores = [
+        rank_score(
+            dev_skills[i],
+            affinities[i],
+            jumps[i],
+            skills,
+            skills_points_per,
+            associate_rebel_affinity,
+            associate_rebel_affinity_points_per,
+            max_distance_points,
+            distance_decay_per_jump)
+        for i in range(len(dev_skills))
+    ]
+    if limit is not None:
+        top = heapq.nlargest(limit, range(len(scores)), key=lambda i: scores[i][0])
+    else:
+        top = sorted(range(len(scores)), key=lambda i: scores[i][0], reverse=True)
+    result = []
+    for i in top:
+        dev = dev_from_columns(columns, i)
+        dev.ranking_score, dev.matching_skills = scores[i]
+        result.append(dev)
+    return result
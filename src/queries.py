@@ -0,0 +1,192 @@
+"""Named, fully parameterized Cypher for the app's queries.
+
+Every statement's text is constant, values only ever arrive as parameters, so each query is
+planned once and then served from the server's plan cache. Registering a statement with inline
+string or number literals raises a ValueError.
+"""
+from dataclasses import dataclass
+import datetime
+import re
+from neo4j_driver import execute_query, submit_query, profile_query
+
+@dataclass(frozen=True)
+class NamedQuery:
+    name: str
+    text: str
+    # Server-side transaction timeout in seconds, None for neo4j_driver.DEFAULT_TIMEOUT
+    timeout: float = None
+    # Result cache TTL in seconds, 0 to not cache
+    ttl: float = 0.0
+
+QUERIES = {}
+
+# Variable length bounds (-[*0..100]-) can't be parameters in Cypher, so they are the only numbers
+# allowed, and only inside a relationship pattern so that arithmetic like x*2 is still caught
+_RELATIONSHIP_PATTERN = re.compile(r"(?<=-)\[[^\]]*\]")
+_VAR_LENGTH_BOUNDS = re.compile(r"\*\s*\d*\s*(\.\.\s*\d*)?")
+_IGNORED = re.compile(r"//[^\n]*|`[^`]*`|\$\w+")
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|(?<![\w.])(?:\d+(?:\.\d+)?|\.\d+)(?:[eE][+-]?\d+)?(?!\w)")
+
+def inline_literals(text: str) -> list[str]:
+    """String and number literals in a Cypher statement, other than variable length bounds."""
+    stripped = _RELATIONSHIP_PATTERN.sub(lambda m: _VAR_LENGTH_BOUNDS.sub(" ", m.group()), _IGNORED.sub(" ", text))
+    return _LITERALS.findall(stripped)
+
+def register(query: NamedQuery) -> NamedQuery:
+    literals = inline_literals(query.text)
+    if literals:
+        raise ValueError(f"Query '{query.name}' has inline literals {literals}, pass them as parameters")
+    QUERIES[query.name] = query
+    return query
+
+REBEL_SYSTEMS = register(NamedQuery(
+    name='rebel_systems',
+    text="""
+MATCH (s:System)
+WHERE ANY (affinity IN s.rebel_affinity WHERE affinity > $minimum_rebel_affinity)
+RETURN DISTINCT s
+    """,
+    timeout=10.0,
+    ttl=300.0,
+))
+
+TOP_SKILLS = register(NamedQuery(
+    name='top_skills',
+    text="""
+MATCH (:Person)-[:KNOWS]->(t:Topic)
+RETURN DISTINCT t.name as name, count(t.name) as count
+ORDER BY count DESC LIMIT $max
+    """,
+    timeout=10.0,
+    ttl=30.0,
+))
+
+# $systems is [{name, jumps}] for the systems within the jump limit of the base, looked up in the
+# jump matrix (see network.reachable_within). Each one is an index seek on System.name followed by
+# its FROM relationships, so the work grows with the people living there rather than with paths.
+# UNWIND order doesn't survive the MATCH and CALL, the ORDER BY keeps the team to the closest developers
+FIND_DEVELOPERS = register(NamedQuery(
+    name='find_developers',
+    text="""
+UNWIND $systems AS system
+MATCH (s:System {name: system.name})<-[:FROM]-(p:Person)
+WITH s, p, system.jumps as jumps, COLLECT { MATCH (p)-[:KNOWS]->(t:Topic) WHERE ANY (name IN t.name WHERE name in $req_skills) RETURN DISTINCT t.name } as skills
+WHERE skills <> []
+CALL {
+    WITH p
+    MATCH (p)-[:KNOWS]->(c:Character)
+    WHERE c.rebel_affinity >= $reb_affinity
+    WITH DISTINCT c
+    RETURN collect(c.name) as associates, avg(c.rebel_affinity) as avg_affinity
+}
+WITH s, p, jumps, skills, associates, avg_affinity
+WHERE associates <> []
+RETURN p.name as name, s.name as homeworld, skills, associates, avg_affinity
+ORDER BY jumps LIMIT $team_size
+    """,
+    timeout=30.0,
+    ttl=60.0,
+))
+
+SYSTEM_LINKS = register(NamedQuery(
+    name='system_links',
+    text="""
+MATCH (a:System)-[:CONNECTED_TO|NEAR]->(b:System)
+RETURN a.name as source, b.name as target
+    """,
+    timeout=10.0,
+    ttl=300.0,
+))
+
+# The rank queries differ only in where (s, p, jumps) rows come from, this is the rest.
+# Skills and associates are gathered in separate subqueries per person, matching both in one
+# pattern would make |skills| x |associates| rows per person and weight the affinity average
+_RANK_PEOPLE = """WHERE p.created_at >= datetime($datetime_cutoff)
+    AND EXISTS { (p)-[:KNOWS]->(:Topic) }
+    AND EXISTS { (p)-[:KNOWS]->(:Character) }
+CALL {
+    WITH p
+    MATCH (p)-[:KNOWS]->(c:Character)
+    WITH DISTINCT c
+    RETURN collect(c.name) as associates, avg(c.rebel_affinity) as avg_associate_affinity
+}
+RETURN p.name as name, toString(p.created_at) as createdAt, p.email as email, s.name as homeworld, associates,
+    COLLECT { MATCH (p)-[:KNOWS]->(t:Topic) RETURN DISTINCT t.name } as devSkills, avg_associate_affinity, jumps as jumpsFromBase
+    """
+
+# $systems is [{name, jumps}] for every system within reach of the base, from the jump matrix
+# or a vectorized BFS over the system_links snapshot (see network.distances_from)
+RANK_INFO = register(NamedQuery(
+    name='rank_info',
+    text="""
+UNWIND $systems AS system
+MATCH (s:System {name: system.name})<-[:FROM]-(p:Person)
+WITH s, p, system.jumps as jumps
+""" + _RANK_PEOPLE,
+    timeout=30.0,
+    ttl=30.0,
+))
+
+# Jump distances written ahead of time by distance_table.py, read through the JumpDistance(base, version)
+# index. Only the rows of the table the base's JumpTable points to, a forced rewrite writes a new table
+# next to the old one and switches the pointer last
+RANK_INFO_MATERIALIZED = register(NamedQuery(
+    name='rank_info_materialized',
+    text="""
+MATCH (t:JumpTable {base: $base, version: $version})
+MATCH (d:JumpDistance {base: $base, version: $version}) WHERE d.table = t.table
+MATCH (s:System {name: d.system})<-[:FROM]-(p:Person)
+WITH s, p, d.jumps as jumps
+""" + _RANK_PEOPLE,
+    timeout=30.0,
+    ttl=30.0,
+))
+
+# Bases whose jump distances are fully written for a graph version. Tables written before they had
+# ids are left out, so they are rewritten rather than read
+JUMP_TABLES = register(NamedQuery(
+    name='jump_tables',
+    text="""
+MATCH (t:JumpTable {version: $version}) WHERE t.table IS NOT NULL
+RETURN t.base as base
+    """,
+    timeout=10.0,
+    ttl=60.0,
+))
+
+def cutoff_param(cutoff_datetime: datetime) -> str:
+    if cutoff_datetime is None:
+        # Set to 1/1/1970
+        cutoff_datetime = datetime.datetime.utcfromtimestamp(0)
+    return cutoff_datetime.isoformat()
+
+def systems_param(jumps: dict) -> list[dict]:
+    """$systems for find_developers and rank_info, from system name -> jumps."""
+    return [{'name': name, 'jumps': n} for name, n in jumps.items()]
+
+def rank_info_params(jumps: dict, cutoff_datetime: datetime) -> dict:
+    """jumps is system name -> jumps from the base."""
+    return {
+        'systems': systems_param(jumps),
+        'datetime_cutoff': cutoff_param(cutoff_datetime)
+    }
+
+def rank_info_materialized_params(base: str, version: str, cutoff_datetime: datetime) -> dict:
+    return {
+        'base': base,
+        'version': version,
+        'datetime_cutoff': cutoff_param(cutoff_datetime)
+    }
+
+def run(name: str, params: dict = {}, **kwargs):
+    """execute_query for a registered query, kwargs are passed through."""
+    query = QUERIES[name]
+    return execute_query(query.text, params, name=name, timeout=query.timeout, ttl=query.ttl, **kwargs)
+
+def submit(name: str, params: dict = {}, **kwargs):
+    query = QUERIES[name]
+    return submit_query(query.text, params, name=name, timeout=query.timeout, ttl=query.ttl, **kwargs)
+
+def profile(name: str, params: dict = {}, **kwargs):
+    query = QUERIES[name]
+    return profile_query(query.text, params, name=name, timeout=query.timeout, **kwargs)
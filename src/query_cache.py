@@ -0,0 +1,106 @@
+"""In-process cache for query results with per-entry TTLs and an LRU memory bound."""
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+import json
+import sys
+import threading
+import time
+
+def cache_key(query: str, params: dict = None) -> str:
+    # Whitespace differences in query text shouldn't produce separate entries
+    normalized = " ".join(query.split())
+    return normalized + "\n" + json.dumps(params or {}, sort_keys=True, default=str)
+
+def approx_size(value) -> int:
+    """Rough deep size in bytes of records and the values inside them."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, Mapping) or hasattr(value, 'items'):
+        return size + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(approx_size(v) for v in value)
+    return size
+
+@dataclass
+class CacheEntry:
+    name: str
+    value: object
+    size: int
+    expires_at: float
+
+class QueryCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Bumped by invalidate, everything's and per query name
+        self._generation = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, name: str = None) -> int:
+        """Grows whenever name's entries are invalidated. Part of the key, so a result fetched before an
+        invalidation but put after it lands under a key later lookups no longer use."""
+        with self._lock:
+            return self._generation + self._generations.get(name, 0)
+
+    def get(self, key: str):
+        """Returns the cached value, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: str, value, ttl: float, name: str = None):
+        size = approx_size(value)
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(name, value, size, time.monotonic() + ttl)
+            self.bytes += size
+            # Least recently used entries go first
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, names: list[str] = None) -> int:
+        """Drops entries for the given query names, or everything when names is None. Returns how many were dropped."""
+        with self._lock:
+            if names is None:
+                self._generation += 1
+            else:
+                for name in names:
+                    self._generations[name] = self._generations.get(name, 0) + 1
+            keys = [key for key, entry in self._entries.items() if names is None or entry.name in names]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
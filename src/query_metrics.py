@@ -0,0 +1,137 @@
+"""In-process metrics for named queries: call counts, rows, server timings and latency histograms."""
+from collections import Counter
+from dataclasses import dataclass, field
+import bisect
+import threading
+
+# Upper bounds in milliseconds, the last bucket catches everything slower
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+class Histogram:
+    def __init__(self, bounds: list[float] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, inf if it falls in the overflow bucket."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+@dataclass
+class QueryStats:
+    calls: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    # Served from the last good result while the query's circuit was open
+    stale_hits: int = 0
+    # Waited on an identical query that was already running instead of running it again
+    coalesced: int = 0
+    rows: int = 0
+    latency_ms: Histogram = field(default_factory=Histogram)
+    # Server side, from the ResultSummary
+    available_after_ms: Histogram = field(default_factory=Histogram)
+    consumed_after_ms: Histogram = field(default_factory=Histogram)
+    counters: Counter = field(default_factory=Counter)
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'cache_hits': self.cache_hits,
+            'stale_hits': self.stale_hits,
+            'coalesced': self.coalesced,
+            'rows': self.rows,
+            'total_ms': round(self.latency_ms.total, 1),
+            'mean_ms': round(self.latency_ms.mean, 1),
+            'p50_ms': self.latency_ms.quantile(0.5),
+            'p95_ms': self.latency_ms.quantile(0.95),
+            'p99_ms': self.latency_ms.quantile(0.99),
+            'server_available_after_mean_ms': round(self.available_after_ms.mean, 1),
+            'server_consumed_after_mean_ms': round(self.consumed_after_ms.mean, 1),
+            'counters': dict(self.counters),
+        }
+
+# Summary counters worth keeping, only non-zero values are accumulated
+SUMMARY_COUNTERS = [
+    'nodes_created',
+    'nodes_deleted',
+    'relationships_created',
+    'relationships_deleted',
+    'properties_set',
+    'labels_added',
+    'labels_removed',
+    'indexes_added',
+    'constraints_added',
+]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> QueryStats:
+        name = name or 'unnamed'
+        if name not in self._stats:
+            self._stats[name] = QueryStats()
+        return self._stats[name]
+
+    def record(self, name: str, seconds: float, rows: int, summary=None):
+        with self._lock:
+            stats = self._get(name)
+            stats.calls += 1
+            stats.rows += rows
+            stats.latency_ms.observe(seconds * 1000)
+            if summary is None:
+                return
+            if summary.result_available_after is not None:
+                stats.available_after_ms.observe(summary.result_available_after)
+            if summary.result_consumed_after is not None:
+                stats.consumed_after_ms.observe(summary.result_consumed_after)
+            for counter in SUMMARY_COUNTERS:
+                value = getattr(summary.counters, counter, 0)
+                if value:
+                    stats.counters[counter] += value
+
+    def record_error(self, name: str):
+        with self._lock:
+            self._get(name).errors += 1
+
+    def record_cache_hit(self, name: str):
+        with self._lock:
+            self._get(name).cache_hits += 1
+
+    def record_stale_hit(self, name: str):
+        with self._lock:
+            self._get(name).stale_hits += 1
+
+    def record_coalesced(self, name: str):
+        with self._lock:
+            self._get(name).coalesced += 1
+
+    def snapshot(self) -> dict:
+        """Stats per query name, busiest (by total latency) first."""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: item[1].latency_ms.total, reverse=True)
+            return {name: stats.as_dict() for name, stats in items}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,127 @@
+"""Captures PROFILE plans for the app's queries and flags plan regressions against a stored baseline.
+
+Settings come from .streamlit/secrets.toml or environment variables, see config.py:
+
+    pipenv run python src/query_plans.py capture --baseline   # record the known good plans
+    pipenv run python src/query_plans.py check                # profile again and diff, exits 1 on regressions
+"""
+import argparse
+import json
+import os
+import sys
+import neo4j_driver
+import network
+import queries
+
+PLANS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plans')
+
+# A plan regresses when db hits or estimated rows grow by more than this fraction of the baseline
+GROWTH_TOLERANCE = 0.5
+
+def profiled_params(base: str, skills: list[str]) -> dict:
+    """Representative params per registered query name."""
+    version = network.hyperspace()['version']
+    return {
+        'rebel_systems': {'minimum_rebel_affinity': 0.5},
+        'top_skills': {'max': 10},
+        'find_developers': {'req_skills': skills, 'systems': queries.systems_param(network.reachable_within(base, 10)), 'reb_affinity': 0.5, 'team_size': 6},
+        'rank_info': network.rank_info_params(base, None),
+        'rank_info_materialized': queries.rank_info_materialized_params(base, version, None),
+        'jump_tables': {'version': version},
+    }
+
+def plan_summary(plan: dict) -> dict:
+    """The parts of a server plan worth comparing, children in order."""
+    args = plan.get('args', {})
+    return {
+        'operator': plan.get('operatorType'),
+        'identifiers': sorted(plan.get('identifiers', [])),
+        'estimated_rows': args.get('EstimatedRows'),
+        'db_hits': plan.get('dbHits', args.get('DbHits')),
+        'rows': plan.get('rows', args.get('Rows')),
+        'children': [plan_summary(child) for child in plan.get('children', [])],
+    }
+
+def operators(plan: dict) -> list[str]:
+    return [plan['operator']] + [op for child in plan['children'] for op in operators(child)]
+
+def total(plan: dict, key: str) -> float:
+    return (plan.get(key) or 0) + sum(total(child, key) for child in plan['children'])
+
+def _grew(before: float, after: float) -> bool:
+    return after > before * (1 + GROWTH_TOLERANCE) and after - before > 1
+
+def diff_plans(baseline: dict, current: dict) -> list[str]:
+    """Human readable regressions of current compared to baseline, empty if none."""
+    regressions = []
+    if operators(baseline) != operators(current):
+        regressions.append(f"operators changed: {' > '.join(operators(baseline))} -> {' > '.join(operators(current))}")
+    for key in ['db_hits', 'estimated_rows']:
+        before, after = total(baseline, key), total(current, key)
+        if _grew(before, after):
+            regressions.append(f"{key} grew from {before:.0f} to {after:.0f}")
+    return regressions
+
+def plan_path(name: str, baseline: bool) -> str:
+    return os.path.join(PLANS_DIR, 'baseline' if baseline else 'current', f"{name}.json")
+
+def save_plan(name: str, plan: dict, baseline: bool = False):
+    path = plan_path(name, baseline)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=2, default=str)
+
+def load_plan(name: str, baseline: bool = False) -> dict:
+    path = plan_path(name, baseline)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def default_base() -> str:
+    records = queries.run('rebel_systems', {'minimum_rebel_affinity': 0.5})
+    names = sorted(r.get('s').get('name') for r in records)
+    return names[0] if names else None
+
+def capture(base: str, skills: list[str], baseline: bool = False) -> dict:
+    plans = {}
+    params = profiled_params(base, skills)
+    for name in queries.QUERIES:
+        plans[name] = plan_summary(queries.profile(name, params.get(name, {})))
+        save_plan(name, plans[name], baseline)
+    return plans
+
+def check(base: str, skills: list[str]) -> dict:
+    """Profiles every query and returns regressions per query name."""
+    results = {}
+    for name, plan in capture(base, skills).items():
+        baseline = load_plan(name, baseline=True)
+        results[name] = ["no baseline"] if baseline is None else diff_plans(baseline, plan)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["capture", "check"])
+    parser.add_argument("--baseline", action="store_true", help="store captured plans as the baseline")
+    parser.add_argument("--base", help="rebel base to profile with, defaults to the first rebel system")
+    parser.add_argument("--skills", nargs="*", default=["Python", "JavaScript"])
+    args = parser.parse_args()
+
+    base = args.base or default_base()
+    if args.command == "capture":
+        for name, plan in capture(base, args.skills, args.baseline).items():
+            print(f"{name:<16} db_hits={total(plan, 'db_hits'):<10.0f} {' > '.join(operators(plan))}")
+        neo4j_driver.close_driver()
+        return
+
+    failed = False
+    for name, regressions in check(base, args.skills).items():
+        print(f"{name:<16} {'ok' if not regressions else 'REGRESSED'}")
+        for regression in regressions:
+            print(f"    {regression}")
+        failed = failed or bool(regressions)
+    neo4j_driver.close_driver()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
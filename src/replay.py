@@ -0,0 +1,82 @@
+"""Record query results to a compact log and replay them without a database.
+
+Recording (any process talking to a real database):
+
+    neo4j_driver.set_recorder(replay.Recorder("recordings/app.jsonl.gz"))
+
+Replaying (CI, benchmarks):
+
+    neo4j_driver.set_backend(replay.ReplayBackend("recordings/app.jsonl.gz", latency_scale=1.0))
+"""
+import gzip
+import json
+import threading
+import time
+from neo4j import Record
+from query_cache import cache_key
+
+def encode_value(value):
+    """JSON friendly form of a record value. Nodes and relationships keep only their properties."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if hasattr(value, 'items'):
+        # Node or Relationship, both behave as read only mappings of their properties
+        return {k: encode_value(v) for k, v in value.items()}
+    if hasattr(value, 'iso_format'):
+        return value.iso_format()
+    return str(value)
+
+class Recorder:
+    """Appends one gzipped JSON line per query: name, query, params, keys, rows and elapsed seconds."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, query: str, params: dict, name: str, records: list, seconds: float):
+        keys = list(records[0].keys()) if records else []
+        entry = {
+            'name': name,
+            'key': cache_key(query, params),
+            'keys': keys,
+            'rows': [[encode_value(v) for v in record.values()] for record in records],
+            'seconds': round(seconds, 6),
+        }
+        line = json.dumps(entry, separators=(',', ':'), default=str) + "\n"
+        with self._lock:
+            # Each append is its own gzip member, readers see one continuous stream
+            with gzip.open(self.path, 'at') as f:
+                f.write(line)
+
+def load_recordings(path: str) -> dict:
+    """Entries by cache key. When a query was recorded more than once the last recording wins."""
+    entries = {}
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            entry = json.loads(line)
+            entries[entry['key']] = entry
+    return entries
+
+class ReplayBackend:
+    """Serves recorded records back for the same query text and params.
+
+    latency_scale multiplies each query's recorded time (0 replays instantly, 1 in real time).
+    latency, when given, is a fixed delay in seconds that replaces the recorded one.
+    """
+    def __init__(self, path: str, latency_scale: float = 0.0, latency: float = None):
+        self.entries = load_recordings(path)
+        self.latency_scale = latency_scale
+        self.latency = latency
+
+    def run(self, query: str, params: dict, name: str = None) -> list:
+        entry = self.entries.get(cache_key(query, params))
+        if entry is None:
+            raise LookupError(f"No recording of query '{name or query.strip()[:60]}' with params {params}")
+        delay = self.latency if self.latency is not None else entry['seconds'] * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        keys = entry['keys']
+        return [Record(zip(keys, row)) for row in entry['rows']]
@@ -0,0 +1,137 @@
+"""Indexes and constraints the app's queries rely on, created idempotently and checked at startup.
+
+    pipenv run python src/schema.py          # create what's missing, wait for it, exit 1 if anything isn't online
+    pipenv run python src/schema.py --check  # only report
+"""
+from dataclasses import dataclass
+import argparse
+import logging
+import sys
+import threading
+import time
+from neo4j import WRITE_ACCESS
+from neo4j.exceptions import DriverError, Neo4jError
+from config import secret
+import neo4j_driver
+
+# Seconds to wait for new indexes to come online
+AWAIT_TIMEOUT = int(secret('NEO4J_SCHEMA_AWAIT_TIMEOUT', 300))
+
+@dataclass(frozen=True)
+class SchemaItem:
+    # Index or constraint name, also how SHOW INDEXES/CONSTRAINTS report it
+    name: str
+    statement: str
+    constraint: bool = False
+
+SCHEMA = [
+    # System.name seeks start rank_info, find_developers and every ingest MERGE
+    SchemaItem('system_name_unique', "CREATE CONSTRAINT system_name_unique IF NOT EXISTS FOR (s:System) REQUIRE s.name IS UNIQUE", True),
+    SchemaItem('topic_name_unique', "CREATE CONSTRAINT topic_name_unique IF NOT EXISTS FOR (t:Topic) REQUIRE t.name IS UNIQUE", True),
+    SchemaItem('character_name_unique', "CREATE CONSTRAINT character_name_unique IF NOT EXISTS FOR (c:Character) REQUIRE c.name IS UNIQUE", True),
+    SchemaItem('person_email_unique', "CREATE CONSTRAINT person_email_unique IF NOT EXISTS FOR (p:Person) REQUIRE p.email IS UNIQUE", True),
+    # Registration cutoff filter
+    SchemaItem('person_created_at', "CREATE RANGE INDEX person_created_at IF NOT EXISTS FOR (p:Person) ON (p.created_at)"),
+    # Materialized distances, see distance_table.py
+    SchemaItem('jump_distance_base_version', "CREATE INDEX jump_distance_base_version IF NOT EXISTS FOR (d:JumpDistance) ON (d.base, d.version)"),
+    SchemaItem('jump_table_version', "CREATE INDEX jump_table_version IF NOT EXISTS FOR (t:JumpTable) ON (t.version)"),
+]
+
+# Result of the last ensure() or check(), see last_report
+_report = {}
+
+def _session():
+    return neo4j_driver.get_driver().session(default_access_mode=WRITE_ACCESS)
+
+def states(session) -> dict:
+    """Index and constraint name -> ONLINE, POPULATING or FAILED. A uniqueness constraint's index has
+    the constraint's name, so it reports the state of that index."""
+    found = {r['name']: 'ONLINE' for r in session.run("SHOW CONSTRAINTS YIELD name RETURN name")}
+    found.update({r['name']: r['state'] for r in session.run("SHOW INDEXES YIELD name, state RETURN name, state")})
+    return found
+
+def _finish(report: dict, present: dict, items: list[SchemaItem], started: float) -> dict:
+    for item in items:
+        if present.get(item.name) == 'FAILED':
+            # CREATE ... IF NOT EXISTS is a no-op for it, it has to be dropped and created again
+            if item.name in report['created']:
+                report['created'].remove(item.name)
+            report['failed'][item.name] = "index is FAILED, drop it and run again"
+    report['missing'] = [item.name for item in items if present.get(item.name) != 'ONLINE']
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    _report.clear()
+    _report.update(report)
+    return report
+
+def check(names: list[str] = None) -> dict:
+    """Reports which schema items (all, or the named ones) are missing or not yet online."""
+    started = time.perf_counter()
+    items = [item for item in SCHEMA if names is None or item.name in names]
+    with _session() as session:
+        return _finish({'created': [], 'failed': {}}, states(session), items, started)
+
+def ensure(names: list[str] = None, timeout: int = AWAIT_TIMEOUT) -> dict:
+    """Creates the schema items (all, or the named ones) that don't exist yet and waits for new indexes.
+
+    Safe to run any number of times. A constraint the existing data violates is reported under
+    failed rather than raised, so the rest still gets created.
+    """
+    started = time.perf_counter()
+    items = [item for item in SCHEMA if names is None or item.name in names]
+    report = {'created': [], 'failed': {}}
+    with _session() as session:
+        present = states(session)
+        for item in items:
+            if item.name in present:
+                continue
+            try:
+                session.run(item.statement).consume()
+                report['created'].append(item.name)
+            except Neo4jError as e:
+                report['failed'][item.name] = e.message or str(e)
+        if report['created'] or 'POPULATING' in (present.get(item.name) for item in items):
+            try:
+                session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+            except Neo4jError as e:
+                logging.warning(f"schema: indexes not online after waiting up to {timeout}s: {e.message}")
+            present = states(session)
+    report = _finish(report, present, items, started)
+    if report['missing']:
+        logging.warning(f"schema: missing or not online: {', '.join(report['missing'])}")
+    logging.info(f"schema: created {len(report['created'])} in {report['seconds']}s")
+    return report
+
+def last_report() -> dict:
+    return dict(_report)
+
+_thread = None
+
+def start(enabled: bool = True):
+    """Runs ensure() on a daemon thread, once per process, so startup never waits on index builds."""
+    global _thread
+    if not enabled or _thread is not None:
+        return
+    def run():
+        try:
+            ensure()
+        except (Neo4jError, DriverError) as e:
+            logging.warning(f"schema: could not ensure indexes and constraints: {e}")
+    _thread = threading.Thread(target=run, name="neo4j-schema", daemon=True)
+    _thread.start()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report missing indexes and constraints")
+    args = parser.parse_args()
+    report = check() if args.check else ensure()
+    for name in report['created']:
+        print(f"created  {name}")
+    for name, error in report['failed'].items():
+        print(f"failed   {name}: {error}")
+    for name in report['missing']:
+        print(f"missing  {name}")
+    neo4j_driver.close_driver()
+    sys.exit(1 if report['missing'] else 0)
+
+if __name__ == "__main__":
+    main()
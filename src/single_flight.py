@@ -0,0 +1,61 @@
+"""Coalesces identical concurrent calls, so callers that arrive while a call is in flight share its result."""
+from dataclasses import dataclass, field
+import asyncio
+import concurrent.futures
+import threading
+
+@dataclass
+class Flight:
+    future: concurrent.futures.Future = field(default_factory=concurrent.futures.Future)
+    waiters: int = 1
+    # Set when the call runs as an asyncio task, so the last waiter to leave can cancel it
+    task: asyncio.Task = None
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """Returns the flight for key and whether the caller leads it. The leader must settle it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def leave(self, key: str, flight: Flight) -> bool:
+        """A waiter stopped waiting. Returns True when nobody is waiting on the flight any more,
+        later callers then start a new flight rather than join one about to be cancelled."""
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters > 0:
+                return False
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            return True
+
+    def settle(self, key: str, flight: Flight, result=None, error: BaseException = None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def settle_from(self, key: str, flight: Flight, task: asyncio.Task):
+        """Done callback for a flight's task."""
+        if task.cancelled():
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.future.cancel()
+        else:
+            self.settle(key, flight, None if task.exception() else task.result(), task.exception())
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -8,4 +8,13 @@ def list_from_csv(url, column_name):
     lines = response.text.strip().split('\n')
     reader = csv.DictReader(lines)
     column_values = [row[column_name] for row in reader]
-    return column_values
\ No newline at end of file
+    return column_values
+
+def rerun_check():
+    """Cancel check for neo4j_driver that stops waiting on a query once this session has rerun or stopped.
+
+    Updating an element is where Streamlit raises its rerun/stop exception in the script thread,
+    so each check clears an invisible placeholder. Don't use from inside st.cache_data functions.
+    """
+    placeholder = st.empty()
+    return placeholder.empty